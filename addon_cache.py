@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import Counter
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """SHA-256 hex digest of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class AddonCache:
+    """On-disk cache of fixed archives and their summaries, keyed by input hash.
+
+    Each entry is `<key>.mcaddon` plus `<key>.json` in `directory`. The file
+    mtime doubles as the LRU timestamp; when the total size goes above
+    `max_bytes` the least recently used entries are deleted.
+
+    Entries returned by get() and put() are pinned so eviction leaves their
+    archive alone until the caller is done with it and calls release().
+    """
+
+    def __init__(self, directory, max_bytes, version):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.pinned = Counter()
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, file_path):
+        """Cache key for an input archive: its content hash and the fixer version"""
+        return self.key_for(hash_file(file_path))
+
+    def key_for(self, digest):
+        """Cache key for an input whose SHA-256 hex digest is already known"""
+        return f"{digest}-v{self.version}"
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + ".mcaddon", base + ".json"
+
+    def get(self, key):
+        """Return (archive_path, summaries) for a cached entry and pin it, or None"""
+        archive_path, summary_path = self._paths(key)
+        with self.lock:
+            try:
+                with open(summary_path, 'r', encoding='utf-8') as f:
+                    summaries = json.load(f)
+                os.utime(archive_path)
+                os.utime(summary_path)
+            except (OSError, ValueError):
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.pinned[key] += 1
+            return archive_path, summaries
+
+    def put(self, key, fixed_path, summaries):
+        """Move a freshly fixed archive into the cache, pin it and return its cached path"""
+        archive_path, summary_path = self._paths(key)
+        with self.lock:
+            shutil.move(fixed_path, archive_path)
+            with open(summary_path, 'w', encoding='utf-8') as f:
+                json.dump(summaries, f)
+            self.pinned[key] += 1
+            self._evict()
+        return archive_path
+
+    def release(self, key):
+        """Unpin an entry returned by get() or put() once its archive has been read"""
+        with self.lock:
+            self.pinned[key] -= 1
+            if self.pinned[key] <= 0:
+                del self.pinned[key]
+
+    def _evict(self):
+        entries = {}
+        for name in os.listdir(self.directory):
+            key, ext = os.path.splitext(name)
+            if ext not in (".mcaddon", ".json"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            size, used = entries.get(key, (0, 0))
+            entries[key] = (size + stat.st_size, max(used, stat.st_mtime))
+
+        total = sum(size for size, _ in entries.values())
+        for key, (size, _) in sorted(entries.items(), key=lambda e: e[1][1]):
+            if total <= self.max_bytes:
+                break
+            if key in self.pinned:
+                continue
+            for path in self._paths(key):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+            self.evictions += 1
+
+    def size(self):
+        total = 0
+        for name in os.listdir(self.directory):
+            try:
+                total += os.path.getsize(os.path.join(self.directory, name))
+            except OSError:
+                pass
+        return total
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "bytes": self.size(),
+            "max_bytes": self.max_bytes,
+        }
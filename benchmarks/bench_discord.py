@@ -0,0 +1,158 @@
+"""Benchmark the Discord addon fixer pipeline on synthetic addons.
+
+Every stage runs in a fresh process so its peak RSS is not inflated by earlier
+stages, with its own temp dir so temp-disk usage can be measured.
+
+    python benchmarks/bench_discord.py --items 100,1000,5000 --asset-mb 50 --nested
+    python benchmarks/bench_discord.py --json results.json
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from generate_addon import generate_addon  # noqa: E402
+from runner import check_stages, peak_rss_mb, run_stages  # noqa: E402
+
+
+def dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            try:
+                total += os.path.getsize(os.path.join(root, file))
+            except OSError:
+                pass  # removed while walking
+    return total
+
+
+class DiskWatcher(threading.Thread):
+    """Polls a directory in the background and remembers its largest size"""
+
+    def __init__(self, path, interval=0.02):
+        super().__init__(daemon=True)
+        self.path = path
+        self.interval = interval
+        self.peak = 0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.peak = max(self.peak, dir_size(self.path))
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.peak = max(self.peak, dir_size(self.path))
+        return self.peak
+
+
+def stage_fix_only(addon_path, workdir):
+    import fixer
+
+    with zipfile.ZipFile(addon_path) as zip_in:
+        for info in zip_in.infolist():
+            if fixer.engine.wants(info.filename):
+                fixer.fix_json_bytes(zip_in.read(info), info.filename)
+
+
+def stage_stream(addon_path, workdir):
+    import fixer
+
+    fixer.stream_mcaddon(addon_path, os.path.join(workdir, "out_stream.mcaddon"))
+
+
+def stage_extract(addon_path, workdir):
+    import fixer
+
+    fixer.extract_mcaddon(addon_path, os.path.join(workdir, "out_extract.mcaddon"))
+
+
+def stage_hash(addon_path, workdir):
+    from addon_cache import hash_file
+
+    hash_file(addon_path)
+
+
+STAGES = {
+    "hash": stage_hash,
+    "fix_only": stage_fix_only,
+    "stream": stage_stream,
+    "extract": stage_extract,
+}
+
+
+def run_stage(name, addon_path, results):
+    workdir = tempfile.mkdtemp(prefix=f"bench-{name}-")
+    tempfile.tempdir = workdir
+    watcher = DiskWatcher(workdir)
+    watcher.start()
+    try:
+        start = time.perf_counter()
+        STAGES[name](addon_path, workdir)
+        wall = time.perf_counter() - start
+        results.put({
+            "wall_s": wall,
+            "peak_rss_mb": peak_rss_mb(),
+            "temp_disk_peak_mb": watcher.stop() / 1024 / 1024,
+        })
+    finally:
+        watcher.stopped.set()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the addon fixer pipeline")
+    parser.add_argument("--items", default="100,1000,5000", help="comma separated item counts")
+    parser.add_argument("--broken", type=float, default=0.1, help="share of items with broken tags")
+    parser.add_argument("--asset-mb", type=float, default=20, help="size of random binary assets")
+    parser.add_argument("--nested", action="store_true", help="nest packs as .mcpack archives")
+    parser.add_argument("--stages", default=",".join(STAGES), help="comma separated stages to run")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per stage, the fastest is kept")
+    parser.add_argument("--timeout", type=float, default=600, help="seconds before a stage run counts as failed")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    stages = check_stages(parser, args.stages, STAGES)
+    rows = []
+    workdir = tempfile.mkdtemp(prefix="bench-addons-")
+    try:
+        for items in (int(n) for n in args.items.split(",")):
+            addon_path = os.path.join(workdir, f"bench_{items}.mcaddon")
+            generate_addon(addon_path, items, args.broken, args.nested, args.asset_mb)
+            input_mb = os.path.getsize(addon_path) / 1024 / 1024
+
+            for stage, best, error in run_stages(run_stage, stages, (addon_path,), args.repeat, args.timeout):
+                if error is not None:
+                    print(f"{items:>7} items {input_mb:8.1f} MB  {stage:<9} failed: {error}")
+                    continue
+                row = {"items": items, "input_mb": input_mb, "stage": stage, **best}
+                rows.append(row)
+                print(f"{items:>7} items {input_mb:8.1f} MB  {stage:<9}"
+                      f"{row['wall_s']:8.3f} s  {row['peak_rss_mb']:8.1f} MB RSS"
+                      f"  {row['temp_disk_peak_mb']:8.1f} MB temp")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({
+                "items": args.items,
+                "broken": args.broken,
+                "asset_mb": args.asset_mb,
+                "nested": args.nested,
+                "results": rows,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
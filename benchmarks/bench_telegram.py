@@ -0,0 +1,166 @@
+"""Benchmark the Telegram column saturation pipeline on synthetic textures.
+
+Every stage runs in a fresh process so its peak RSS is not inflated by earlier
+stages. Stages after `compress` start from the compressed image; the RSS
+reached while preparing it is reported as setup_rss_mb.
+
+    python benchmarks/bench_telegram.py --sizes 64x64,512x512,4096x4096 --transparent 0,0.5,0.9
+    python benchmarks/bench_telegram.py --target 256 --no-numpy --json results.json
+"""
+import argparse
+import importlib.util
+import io
+import json
+import os
+import subprocess
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+from generate_image import generate_image, parse_size  # noqa: E402
+from runner import check_stages, peak_rss_mb, run_stages  # noqa: E402
+
+
+def load_bot(use_numpy=True):
+    # The file name has a space in it, so it can't be imported by name
+    spec = importlib.util.spec_from_file_location("telegram_bot", os.path.join(ROOT, "bot Telegram.py"))
+    bot = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(bot)
+    if not use_numpy:
+        bot.np = None
+    return bot
+
+
+def compressed(bot, png, options):
+    from PIL import Image
+
+    return bot.compress_image(Image.open(io.BytesIO(png)), (options["target"], options["target"]))
+
+
+def stage_compress(bot, png, options):
+    from PIL import Image
+
+    def run():
+        bot.compress_image(Image.open(io.BytesIO(png)), (options["target"], options["target"]))
+        return {"frames": 0}
+    return run
+
+
+def stage_frames(bot, png, options):
+    image = compressed(bot, png, options)
+
+    def run():
+        return {"frames": len(bot.process_image_columns(image, options["percent"]))}
+    return run
+
+
+def stage_encode(bot, png, options):
+    frames = bot.process_image_columns(compressed(bot, png, options), options["percent"])
+    settings = bot.PNG_PRESETS[options["preset"]]
+
+    def run():
+        size = sum(len(bot.image_to_bytes(frame, **settings)) for frame in frames)
+        return {"frames": len(frames), "output_bytes": size}
+    return run
+
+
+def stage_zip(bot, png, options):
+    image = compressed(bot, png, options)
+
+    def run():
+        frames = bot.iter_column_frames(image, options["percent"])
+        data = bot.create_zip_archive(frames, "bench.png", image.size, options["percent"], options["preset"])
+        return {"frames": image.size[0] + 1, "output_bytes": len(data)}
+    return run
+
+
+STAGES = {
+    "compress": stage_compress,
+    "frames": stage_frames,
+    "encode": stage_encode,
+    "zip": stage_zip,
+}
+
+
+def run_stage(name, png, options, results):
+    bot = load_bot(options["numpy"])
+    if options["workers"]:
+        bot.PNG_WORKERS = options["workers"]
+    run = STAGES[name](bot, png, options)
+    setup_rss = peak_rss_mb()
+
+    start = time.perf_counter()
+    counts = run()
+    wall = time.perf_counter() - start
+    results.put({
+        "wall_s": wall,
+        "peak_rss_mb": peak_rss_mb(),
+        "setup_rss_mb": setup_rss,
+        "fps": counts["frames"] / wall if counts["frames"] and wall else None,
+        **counts,
+    })
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Telegram column saturation pipeline")
+    parser.add_argument("--sizes", default="64x64,512x512,2048x2048", help="comma separated WIDTHxHEIGHT input sizes")
+    parser.add_argument("--transparent", default="0,0.5,0.9", help="comma separated shares of transparent pixels")
+    parser.add_argument("--target", type=int, default=64, help="compress_image() max width and height")
+    parser.add_argument("--percent", type=int, default=100, help="saturation percentage")
+    parser.add_argument("--preset", default="balanced", help="PNG encoder preset")
+    parser.add_argument("--workers", type=int, default=0, help="PNG encoder threads (default: PNG_WORKERS)")
+    parser.add_argument("--no-numpy", action="store_true", help="use the pure Python per-pixel loops")
+    parser.add_argument("--stages", default=",".join(STAGES), help="comma separated stages to run")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per stage, the fastest is kept")
+    parser.add_argument("--timeout", type=float, default=600, help="seconds before a stage run counts as failed")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    options = {
+        "target": args.target,
+        "percent": args.percent,
+        "preset": args.preset,
+        "workers": args.workers,
+        "numpy": not args.no_numpy,
+    }
+    stages = check_stages(parser, args.stages, STAGES)
+    rows = []
+    for size in (parse_size(s) for s in args.sizes.split(",")):
+        for transparent in (float(t) for t in args.transparent.split(",")):
+            png = generate_image(size, transparent)
+            input_kb = len(png) / 1024
+
+            for stage, best, error in run_stages(run_stage, stages, (png, options), args.repeat, args.timeout):
+                if error is not None:
+                    label = f"{size[0]}x{size[1]}"
+                    print(f"{label:>9} {transparent:4.0%} transparent  {stage:<9} failed: {error}")
+                    continue
+                row = {"size": f"{size[0]}x{size[1]}", "transparent": transparent,
+                       "input_kb": input_kb, "stage": stage, **best}
+                rows.append(row)
+                fps = f"{row['fps']:8.0f} fps" if row["fps"] else " " * 12
+                output = f"{row['output_bytes'] / 1024:8.1f} KB out" if "output_bytes" in row else ""
+                print(f"{row['size']:>9} {transparent:4.0%} transparent  {stage:<9}"
+                      f"{row['wall_s']:8.3f} s  {row['peak_rss_mb']:8.1f} MB RSS{fps}  {output}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({
+                "commit": git_commit(),
+                "sizes": args.sizes,
+                "transparent": args.transparent,
+                **options,
+                "results": rows,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Fake Discord messages and attachments for driving bot.on_message without a gateway.
+
+Attachments are served over HTTP by AttachmentServer so the bot downloads
+them the same way it downloads from Discord's CDN. Replies are recorded on
+the FakeMessage instead of being sent anywhere.
+"""
+import itertools
+import os
+import time
+
+from aiohttp import web
+
+message_ids = itertools.count(1)
+
+
+class AttachmentServer:
+    """Serves files by name from memory or disk, standing in for Discord's CDN"""
+
+    def __init__(self):
+        self.files = {}
+        self.runner = None
+        self.url = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        app = web.Application()
+        app.router.add_get("/attachments/{name}", self.download)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+        host, port = self.runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    def add(self, name, path):
+        """Serve the file at `path`, return its attachment URL"""
+        self.files[name] = path
+        return f"{self.url}/attachments/{name}"
+
+    async def download(self, request):
+        path = self.files.get(request.match_info["name"])
+        if path is None:
+            raise web.HTTPNotFound()
+        return web.FileResponse(path)
+
+
+class FakeUser:
+    def __init__(self, user_id, bot=False):
+        self.id = user_id
+        self.bot = bot
+        self.mention = f"<@{user_id}>"
+
+    def __str__(self):
+        return f"user{self.id}"
+
+
+class FakeGuild:
+    def __init__(self, guild_id, filesize_limit=25 * 1024 * 1024):
+        self.id = guild_id
+        self.filesize_limit = filesize_limit
+
+
+class FakeAttachment:
+    def __init__(self, filename, url, size):
+        self.filename = filename
+        self.url = url
+        self.size = size
+
+
+class FakeSentMessage:
+    def __init__(self, channel, content):
+        self.id = next(message_ids)
+        self.channel = channel
+        self.content = content
+        self.edits = 0
+
+    async def edit(self, content=None, **kwargs):
+        self.content = content
+        self.edits += 1
+
+
+class FakeChannel:
+    def __init__(self, channel_id):
+        self.id = channel_id
+        self.sent = []
+
+    async def send(self, content=None, **kwargs):
+        message = FakeSentMessage(self, content)
+        self.sent.append(message)
+        return message
+
+
+class FakeMessage:
+    """An incoming message with attachments; reply() records what the bot sends back"""
+
+    def __init__(self, author, guild, channel, attachments, content=""):
+        self.id = next(message_ids)
+        self.author = author
+        self.guild = guild
+        self.channel = channel
+        self.attachments = attachments
+        self.content = content
+        self.replies = []
+
+    async def reply(self, content=None, embed=None, files=None, **kwargs):
+        files = files or []
+        sizes = []
+        for file in files:
+            fp = file.fp
+            fp.seek(0, os.SEEK_END)
+            sizes.append(fp.tell())
+            file.close()
+        self.replies.append({"content": content, "embed": embed, "files": [f.filename for f in files],
+                             "bytes": sum(sizes), "time": time.perf_counter()})
+        return FakeSentMessage(self.channel, content)
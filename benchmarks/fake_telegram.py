@@ -0,0 +1,117 @@
+"""A local stand-in for the parts of the Telegram Bot API the bot uses.
+
+Serves getUpdates (long polling), getFile, file downloads, sendMessage,
+editMessageText and sendDocument. Load tests queue uploads with upload()
+and await the document the bot answers with; point the bot at it with
+TELEGRAM_API_URL (see load_test.py).
+"""
+import asyncio
+import itertools
+import time
+from collections import defaultdict
+
+from aiohttp import web
+
+
+class FakeTelegramAPI:
+    """Bot API endpoints backed by in-memory queues.
+
+    `retry_every` makes every n-th sendMessage/editMessageText answer with a
+    429 asking for `retry_after` seconds, like Telegram does under load.
+    """
+
+    def __init__(self, token="TEST", retry_every=0, retry_after=1):
+        self.token = token
+        self.retry_every = retry_every
+        self.retry_after = retry_after
+        self.updates = []
+        self.new_update = asyncio.Event()
+        self.update_ids = itertools.count(1)
+        self.message_ids = itertools.count(1)
+        self.files = {}
+        self.waiting = defaultdict(list)  # chat id -> futures for its next documents
+        self.calls = defaultdict(int)
+        self.rate_limited = 0
+        self.runner = None
+
+    def app(self):
+        app = web.Application(client_max_size=256 * 1024 * 1024)
+        app.router.add_route("*", f"/bot{self.token}/getUpdates", self.get_updates)
+        app.router.add_route("*", f"/bot{self.token}/getFile", self.get_file)
+        app.router.add_route("*", f"/bot{self.token}/{{method}}", self.send)
+        app.router.add_get(f"/file/bot{self.token}/{{path}}", self.download)
+        return app
+
+    async def start(self, host="127.0.0.1", port=0):
+        """Start serving, return the base URL to use as TELEGRAM_API_URL"""
+        self.runner = web.AppRunner(self.app())
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+        host, port = self.runner.addresses[0][:2]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    def push(self, chat_id, message):
+        self.updates.append({"update_id": next(self.update_ids), "message": dict(message, chat={"id": chat_id})})
+        self.new_update.set()
+
+    def upload(self, chat_id, file_name, data, mime_type="image/png"):
+        """Queue a document message from `chat_id`, return a future for the bot's sendDocument"""
+        file_id = f"file{len(self.files)}"
+        self.files[file_id] = data
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[chat_id].append(future)
+        self.push(chat_id, {"document": {"file_name": file_name, "file_size": len(data),
+                                         "mime_type": mime_type, "file_id": file_id}})
+        return future
+
+    async def params(self, request):
+        params = dict(request.query)
+        if request.method == "POST":
+            params.update(await request.post())
+        return params
+
+    async def get_updates(self, request):
+        self.calls["getUpdates"] += 1
+        params = await self.params(request)
+        offset = int(params.get("offset", 0))
+        self.updates = [update for update in self.updates if update["update_id"] >= offset]
+        if not self.updates:
+            self.new_update.clear()
+            try:
+                await asyncio.wait_for(self.new_update.wait(), float(params.get("timeout", 0)))
+            except asyncio.TimeoutError:
+                pass
+        return web.json_response({"ok": True, "result": self.updates})
+
+    async def get_file(self, request):
+        self.calls["getFile"] += 1
+        file_id = (await self.params(request))["file_id"]
+        if file_id not in self.files:
+            return web.json_response({"ok": False, "error_code": 400, "description": "file not found"}, status=400)
+        return web.json_response({"ok": True, "result": {"file_id": file_id, "file_path": file_id}})
+
+    async def download(self, request):
+        return web.Response(body=self.files[request.match_info["path"]])
+
+    async def send(self, request):
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        if (self.retry_every and method in ("sendMessage", "editMessageText")
+                and self.calls[method] % self.retry_every == 0):
+            self.rate_limited += 1
+            return web.json_response({"ok": False, "error_code": 429, "description": "Too Many Requests",
+                                      "parameters": {"retry_after": self.retry_after}}, status=429)
+
+        params = await self.params(request)
+        chat_id = int(params["chat_id"])
+        if method == "sendDocument":
+            document = params["document"]
+            waiting = self.waiting.get(chat_id)
+            if waiting:
+                waiting.pop(0).set_result({"file_name": document.filename, "size": len(document.file.read()),
+                                           "time": time.perf_counter()})
+        return web.json_response({"ok": True, "result": {"message_id": next(self.message_ids), "chat": {"id": chat_id}}})
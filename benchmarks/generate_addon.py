@@ -0,0 +1,90 @@
+"""Build synthetic .mcaddon archives for benchmarking the Discord fixer.
+
+    python benchmarks/generate_addon.py out.mcaddon --items 2000 --broken 0.1 --nested --asset-mb 50
+"""
+import argparse
+import io
+import json
+import random
+import zipfile
+
+
+def item_json(index, broken):
+    components = {
+        "minecraft:icon": {"texture": f"item_{index}"},
+        "minecraft:max_stack_size": 64,
+        "minecraft:display_name": {"value": f"Item {index}"},
+    }
+    if broken:
+        for tag in range(1 + index % 3):
+            components[f"tag:bench:group_{tag}"] = {}
+
+    return json.dumps({
+        "format_version": "1.20.50",
+        "minecraft:item": {
+            "description": {"identifier": f"bench:item_{index}"},
+            "components": components,
+        },
+    }, indent=2)
+
+
+def write_pack(zip_out, prefix, files):
+    for name, data in files:
+        zip_out.writestr(prefix + name, data)
+
+
+def behavior_pack(items, broken_ratio, rng):
+    files = [("manifest.json", json.dumps({"format_version": 2, "header": {"name": "Bench BP"}}))]
+    for index in range(items):
+        files.append((f"items/item_{index}.json", item_json(index, rng.random() < broken_ratio)))
+    return files
+
+
+def resource_pack(asset_bytes, rng, asset_size=256 * 1024):
+    files = [("manifest.json", json.dumps({"format_version": 2, "header": {"name": "Bench RP"}}))]
+    index = 0
+    while asset_bytes > 0:
+        size = min(asset_size, asset_bytes)
+        # Random bytes behave like already-compressed textures and sounds
+        files.append((f"textures/asset_{index}.png", rng.randbytes(size)))
+        asset_bytes -= size
+        index += 1
+    return files
+
+
+def pack_bytes(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_out:
+        write_pack(zip_out, "", files)
+    return buffer.getvalue()
+
+
+def generate_addon(path, items=1000, broken_ratio=0.1, nested=False, asset_mb=10, seed=0):
+    """Write a synthetic addon to `path`, nesting the packs as .mcpack files when `nested` is set"""
+    rng = random.Random(seed)
+    bp = behavior_pack(items, broken_ratio, rng)
+    rp = resource_pack(int(asset_mb * 1024 * 1024), rng)
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zip_out:
+        if nested:
+            zip_out.writestr("Bench_BP.mcpack", pack_bytes(bp))
+            zip_out.writestr("Bench_RP.mcpack", pack_bytes(rp))
+        else:
+            write_pack(zip_out, "Bench_BP/", bp)
+            write_pack(zip_out, "Bench_RP/", rp)
+
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic .mcaddon")
+    parser.add_argument("path")
+    parser.add_argument("--items", type=int, default=1000, help="number of item JSON files")
+    parser.add_argument("--broken", type=float, default=0.1, help="share of items with broken tag:* components")
+    parser.add_argument("--nested", action="store_true", help="store the packs as nested .mcpack archives")
+    parser.add_argument("--asset-mb", type=float, default=10, help="size of random binary assets")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    generate_addon(args.path, args.items, args.broken, args.nested, args.asset_mb, args.seed)
+    print(f"Wrote {args.path}")
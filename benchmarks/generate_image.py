@@ -0,0 +1,47 @@
+"""Build synthetic RGBA textures for benchmarking the Telegram column saturation bot.
+
+    python benchmarks/generate_image.py out.png --size 512x512 --transparent 0.5
+"""
+import argparse
+import io
+import random
+
+from PIL import Image, ImageChops
+
+
+def parse_size(text):
+    width, _, height = text.lower().partition("x")
+    return int(width), int(height or width)
+
+
+def noise(size, rng, amplitude):
+    return Image.frombytes('L', size, rng.randbytes(size[0] * size[1])).point(lambda v: v * amplitude // 256)
+
+
+def generate_image(size=(64, 64), transparent_ratio=0.3, seed=0):
+    """PNG bytes of a gradient texture with light noise and `transparent_ratio` of its pixels fully transparent"""
+    rng = random.Random(seed)
+    gradient = Image.linear_gradient('L').resize(size)
+    # Gradients with some noise compress roughly like real textures, pure noise wouldn't compress at all
+    red = ImageChops.add(gradient, noise(size, rng, 32))
+    green = ImageChops.add(gradient.transpose(Image.Transpose.ROTATE_90).resize(size), noise(size, rng, 32))
+    blue = noise(size, rng, 255)
+    threshold = int(transparent_ratio * 256)
+    alpha = noise(size, rng, 256).point(lambda v: 0 if v < threshold else 255)
+
+    buffer = io.BytesIO()
+    Image.merge('RGBA', (red, green, blue, alpha)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic RGBA PNG")
+    parser.add_argument("path")
+    parser.add_argument("--size", default="64x64", help="WIDTHxHEIGHT")
+    parser.add_argument("--transparent", type=float, default=0.3, help="share of fully transparent pixels")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with open(args.path, 'wb') as f:
+        f.write(generate_image(parse_size(args.size), args.transparent, args.seed))
+    print(f"Wrote {args.path}")
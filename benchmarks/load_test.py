@@ -0,0 +1,218 @@
+"""Load-test either bot offline against local stand-ins for Telegram and Discord.
+
+Every simulated user uploads one file after another and waits for the reply
+before sending the next. Reports throughput and end-to-end latency
+percentiles; inputs differ per upload so the result caches don't hide the work.
+
+    python benchmarks/load_test.py telegram --users 50 --uploads 3 --size 512x512
+    python benchmarks/load_test.py discord --users 20 --uploads 2 --items 500 --json load.json
+
+The Telegram bot runs as its own process pointed at benchmarks/fake_telegram.py;
+the Discord bot's on_message is driven in-process with benchmarks/fake_discord.py.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from generate_addon import generate_addon  # noqa: E402
+from generate_image import generate_image, parse_size  # noqa: E402
+
+
+# random.Random(seed) ignores the sign of the seed, so every input gets its own non-negative one
+WARMUP_SEED = 0
+
+
+def seed_for(user, upload, uploads):
+    return 1 + user * uploads + upload
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))]
+
+
+def summarize(latencies, failures, wall):
+    return {
+        "uploads": len(latencies) + failures,
+        "failed": failures,
+        "wall_s": wall,
+        "throughput_per_s": len(latencies) / wall if wall else 0.0,
+        "p50_s": percentile(latencies, 50),
+        "p99_s": percentile(latencies, 99),
+        "max_s": max(latencies) if latencies else None,
+    }
+
+
+async def run_users(users, uploads, upload_one):
+    """Run `users` concurrent users doing `uploads` uploads each, return (latencies, failures, wall)"""
+    latencies = []
+    failures = 0
+
+    async def user(index):
+        nonlocal failures
+        for upload in range(uploads):
+            latency = await upload_one(index, upload)
+            if latency is None:
+                failures += 1
+            else:
+                latencies.append(latency)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(user(index) for index in range(users)))
+    return latencies, failures, time.perf_counter() - start
+
+
+async def load_telegram(args):
+    from fake_telegram import FakeTelegramAPI
+
+    sizes = [parse_size(size) for size in args.size.split(",")]
+    images = {
+        (user, upload): generate_image(sizes[(user + upload) % len(sizes)], args.transparent,
+                                       seed=seed_for(user, upload, args.uploads))
+        for user in range(args.users) for upload in range(args.uploads)
+    }
+
+    api = FakeTelegramAPI(retry_every=args.retry_every)
+    url = await api.start()
+    env = dict(os.environ, TELEGRAM_TOKEN=api.token, TELEGRAM_API_URL=url)
+    bot = subprocess.Popen([sys.executable, os.path.join(ROOT, "bot Telegram.py")], env=env,
+                           stdout=None if args.verbose else subprocess.DEVNULL)
+
+    async def upload_one(user, upload):
+        start = time.perf_counter()
+        reply = api.upload(user + 1, f"user{user}_{upload}.png", images[user, upload])
+        try:
+            result = await asyncio.wait_for(reply, args.timeout)
+        except asyncio.TimeoutError:
+            return None
+        return result["time"] - start
+
+    try:
+        # The first upload also waits for the bot and its worker processes to start
+        warmup = api.upload(0, "warmup.png", generate_image(sizes[0], args.transparent, seed=WARMUP_SEED))
+        await asyncio.wait_for(warmup, args.timeout)
+        calls_before = dict(api.calls)
+        latencies, failures, wall = await run_users(args.users, args.uploads, upload_one)
+    finally:
+        # The bot shuts its worker processes down on SIGTERM
+        bot.terminate()
+        try:
+            bot.wait(30)
+        except subprocess.TimeoutExpired:
+            bot.kill()
+            bot.wait()
+        await api.stop()
+
+    calls = {method: count - calls_before.get(method, 0) for method, count in api.calls.items()}
+    calls.pop("getUpdates", None)
+    result = summarize(latencies, failures, wall)
+    result.update(api_calls=calls, rate_limited=api.rate_limited,
+                  api_calls_per_upload=sum(calls.values()) / max(1, result["uploads"]))
+    return result
+
+
+async def load_discord(args):
+    from fake_discord import AttachmentServer, FakeAttachment, FakeChannel, FakeGuild, FakeMessage, FakeUser
+
+    workdir = tempfile.mkdtemp(prefix="load-discord-")
+    os.environ.setdefault("CACHE_DIR", os.path.join(workdir, "cache"))
+    os.environ.setdefault("METRICS_PORT", "0")
+    import bot
+
+    server = AttachmentServer()
+    await server.start()
+    try:
+        addons = {}
+
+        def add_addon(user, upload, seed):
+            name = f"user{user}_{upload}.mcaddon"
+            path = generate_addon(os.path.join(workdir, name), args.items, args.broken, args.nested,
+                                  args.asset_mb, seed=seed)
+            addons[user, upload] = FakeAttachment(name, server.add(name, path), os.path.getsize(path))
+
+        add_addon(-1, 0, WARMUP_SEED)
+        for user in range(args.users):
+            for upload in range(args.uploads):
+                add_addon(user, upload, seed_for(user, upload, args.uploads))
+
+        guilds = [FakeGuild(guild + 1) for guild in range(args.guilds)]
+
+        async def upload_one(user, upload):
+            message = FakeMessage(FakeUser(user + 1), guilds[user % len(guilds)], FakeChannel(user + 1),
+                                  [addons[user, upload]], args.content)
+            start = time.perf_counter()
+            try:
+                await asyncio.wait_for(bot.on_message(message), args.timeout)
+            except asyncio.TimeoutError:
+                return None
+            replies = [reply for reply in message.replies if reply["files"]]
+            return replies[-1]["time"] - start if replies else None
+
+        # The first upload also waits for the worker processes to start
+        await upload_one(-1, 0)
+        latencies, failures, wall = await run_users(args.users, args.uploads, upload_one)
+        result = summarize(latencies, failures, wall)
+        result["cache"] = bot.cache.stats()
+        return result
+    finally:
+        await server.stop()
+        if bot.http_session is not None:
+            await bot.http_session.close()
+        bot.jobs.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test a bot against local fake APIs")
+    sub = parser.add_subparsers(dest="bot", required=True)
+
+    telegram = sub.add_parser("telegram", help="the Telegram column saturation bot")
+    telegram.add_argument("--size", default="256x256", help="comma separated WIDTHxHEIGHT image sizes")
+    telegram.add_argument("--transparent", type=float, default=0.3, help="share of transparent pixels")
+    telegram.add_argument("--retry-every", type=int, default=0, help="answer every n-th message with a 429")
+    telegram.add_argument("--verbose", action="store_true", help="show the bot's output")
+
+    discord = sub.add_parser("discord", help="the Discord addon fixer bot")
+    discord.add_argument("--items", type=int, default=200, help="item JSON files per addon")
+    discord.add_argument("--broken", type=float, default=0.1, help="share of items with broken tags")
+    discord.add_argument("--asset-mb", type=float, default=1, help="size of random binary assets")
+    discord.add_argument("--nested", action="store_true", help="nest packs as .mcpack archives")
+    discord.add_argument("--guilds", type=int, default=4, help="guilds the users are spread over")
+    discord.add_argument("--content", default="", help="message text sent with each upload, e.g. delta")
+
+    for command in (telegram, discord):
+        command.add_argument("--users", type=int, default=10, help="concurrent users")
+        command.add_argument("--uploads", type=int, default=2, help="uploads per user, one after another")
+        command.add_argument("--timeout", type=float, default=300, help="seconds before an upload counts as failed")
+        command.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    result = asyncio.run(load_telegram(args) if args.bot == "telegram" else load_discord(args))
+    print(f"{result['uploads']} uploads by {args.users} users, {result['failed']} failed, "
+          f"{result['wall_s']:.1f} s: {result['throughput_per_s']:.2f} uploads/s")
+    if result["p50_s"] is not None:
+        print(f"latency p50 {result['p50_s']:.3f} s  p99 {result['p99_s']:.3f} s  max {result['max_s']:.3f} s")
+    for key in ("api_calls", "rate_limited", "cache"):
+        if key in result:
+            print(f"{key}: {result[key]}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({"bot": args.bot, "options": {k: v for k, v in vars(args).items() if k != "json"},
+                       "results": result}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
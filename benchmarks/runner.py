@@ -0,0 +1,70 @@
+"""Runs benchmark stages in fresh processes, shared by bench_discord.py and bench_telegram.py.
+
+A stage target is a module-level function taking its arguments plus a queue
+it puts one result dict on, with at least a `wall_s` entry.
+"""
+import multiprocessing
+import queue
+import resource
+import sys
+import time
+
+
+class StageFailed(Exception):
+    pass
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def check_stages(parser, text, stages):
+    """Split a comma separated --stages value, erroring out on names not in `stages`"""
+    names = text.split(",")
+    unknown = [name for name in names if name not in stages]
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)} (choose from {', '.join(stages)})")
+    return names
+
+
+def measure(target, args, timeout=None):
+    """Run `target(*args, results)` in a fresh process and return the result it puts.
+
+    Raises StageFailed if the process dies without a result (an exception,
+    an OOM kill) or is still running after `timeout` seconds.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    process = ctx.Process(target=target, args=(*args, results))
+    process.start()
+    deadline = time.monotonic() + timeout if timeout else None
+    try:
+        while True:
+            try:
+                return results.get(timeout=1)
+            except queue.Empty:
+                if deadline is not None and time.monotonic() > deadline:
+                    process.terminate()
+                    raise StageFailed(f"timed out after {timeout:g} s") from None
+                if process.is_alive():
+                    continue
+            # The result may still be on its way from a process that just exited
+            try:
+                return results.get(timeout=1)
+            except queue.Empty:
+                raise StageFailed(f"exit code {process.exitcode}") from None
+    finally:
+        process.join()
+
+
+def run_stages(target, stages, args, repeat=1, timeout=None):
+    """Yield (stage, fastest of `repeat` results, None) or (stage, None, error) for each stage"""
+    for stage in stages:
+        try:
+            runs = [measure(target, (stage, *args), timeout) for _ in range(repeat)]
+        except StageFailed as e:
+            yield stage, None, e
+            continue
+        yield stage, min(runs, key=lambda r: r["wall_s"]), None
@@ -1,49 +1,117 @@
-import requests
+import aiohttp
+import asyncio
 import io
-from PIL import Image
+import os
+import hashlib
+import threading
+import multiprocessing
+import itertools
+import signal
 import time
+from PIL import Image
 import json
 import zipfile
 from datetime import datetime
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    import numpy as np  # optional, turns the per-pixel loops into array operations
+except ImportError:
+    np = None
+
+# PNG encoder settings per preset: "fast" trades archive size for latency, "small" the other way round.
+# Pillow's optimize already implies zlib level 9, so only "small" sets it.
+PNG_PRESETS = {
+    "fast": {"optimize": False, "compress_level": 1},
+    "balanced": {"optimize": False, "compress_level": 6},
+    "small": {"optimize": True, "compress_level": 9},
+}
+PNG_PRESET = os.getenv("PNG_PRESET", "balanced")
+
+# Worker processes doing the image work, updates handled at once, and pooled API connections
+TG_WORKERS = int(os.getenv("TG_WORKERS", os.cpu_count() or 1))
+# Threads encoding frames in parallel in each worker process, sharing the cores the workers leave;
+# zlib releases the GIL while compressing
+PNG_WORKERS = int(os.getenv("PNG_WORKERS", max(1, (os.cpu_count() or 1) // max(1, TG_WORKERS))))
+TG_MAX_CONCURRENT = int(os.getenv("TG_MAX_CONCURRENT", 16))
+TG_CONNECTIONS = int(os.getenv("TG_CONNECTIONS", 20))
+
+# Outbound Bot API limits: messages per second overall and per chat, and retries of failed sends
+TG_GLOBAL_RATE = float(os.getenv("TG_GLOBAL_RATE", 30))
+TG_CHAT_RATE = float(os.getenv("TG_CHAT_RATE", 1))
+TG_CHAT_BURST = int(os.getenv("TG_CHAT_BURST", 3))
+TG_SEND_RETRIES = int(os.getenv("TG_SEND_RETRIES", 3))
+
+# Largest image, in pixels, that is decoded at all; bigger uploads are refused from their header
+TG_MAX_PIXELS = int(os.getenv("TG_MAX_PIXELS", 25_000_000))
 
-class TelegramBot:
-    def __init__(self, token):
+# Result cache: memory tier limits, plus an optional on-disk tier when TG_CACHE_DIR is set
+TG_CACHE_MB = float(os.getenv("TG_CACHE_MB", 64))
+TG_CACHE_ENTRIES = int(os.getenv("TG_CACHE_ENTRIES", 256))
+TG_CACHE_DIR = os.getenv("TG_CACHE_DIR", "")
+TG_CACHE_DISK_MB = float(os.getenv("TG_CACHE_DISK_MB", 512))
+
+# What a processed image is sent back as, picked per chat with /mode
+OUTPUT_MODES = {
+    "zip": "ZIP archive with one PNG per frame and a README",
+    "atlas": "one vertical sprite-sheet PNG",
+    "flipbook": "sprite-sheet PNG plus a flipbook_textures.json snippet",
+    "apng": "animated PNG",
+}
+APNG_FRAME_MS = int(os.getenv("APNG_FRAME_MS", 100))
+
+class AsyncTelegramBot:
+    """Telegram Bot API client sharing one pooled, kept-alive connection session"""
+    
+    def __init__(self, token, api_url="https://api.telegram.org", connections=None):
         self.token = token
-        self.base_url = f"https://api.telegram.org/bot{token}"
-        
-    def get_updates(self, offset=None):
+        self.api_url = api_url
+        self.base_url = f"{api_url}/bot{token}"
+        self.connections = connections or TG_CONNECTIONS
+        self.session = None
+    
+    def get_session(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.connections, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(connector=connector)
+        return self.session
+    
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+    
+    async def _call(self, method, what, params=None, data=None, timeout=60):
+        url = f"{self.base_url}/{method}"
+        try:
+            async with self.get_session().post(url, params=params, data=data,
+                                               timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                return await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            print(f"Error {what}: {e}")
+            return {"ok": False}
+    
+    async def get_updates(self, offset=None):
         """Get updates from Telegram"""
-        url = f"{self.base_url}/getUpdates"
         params = {"timeout": 30}
         if offset:
             params["offset"] = offset
-        
-        try:
-            response = requests.get(url, params=params)
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error getting updates: {e}")
-            return {"ok": False, "result": []}
+        result = await self._call("getUpdates", "getting updates", params=params, timeout=40)
+        result.setdefault("result", [])
+        return result
     
-    def send_message(self, chat_id, text):
+    async def send_message(self, chat_id, text):
         """Send a text message"""
-        url = f"{self.base_url}/sendMessage"
-        data = {
-            "chat_id": chat_id,
-            "text": text
-        }
-        
-        try:
-            response = requests.post(url, data=data)
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error sending message: {e}")
-            return {"ok": False}
+        return await self._call("sendMessage", "sending message", data={"chat_id": chat_id, "text": text})
+    
+    async def edit_message_text(self, chat_id, message_id, text):
+        """Replace the text of a message sent earlier"""
+        return await self._call("editMessageText", "editing message",
+                                data={"chat_id": chat_id, "message_id": message_id, "text": text})
     
-    def send_document(self, chat_id, document_data, filename, caption=None, mime_type=None):
+    async def send_document(self, chat_id, document_data, filename, caption=None, mime_type=None):
         """Send a document"""
-        url = f"{self.base_url}/sendDocument"
-        
         # Determine MIME type based on file extension if not provided
         if mime_type is None:
             if filename.lower().endswith('.zip'):
@@ -51,120 +119,299 @@ class TelegramBot:
             else:
                 mime_type = "image/png"
         
-        files = {"document": (filename, document_data, mime_type)}
-        data = {"chat_id": chat_id}
+        form = aiohttp.FormData()
+        form.add_field("chat_id", str(chat_id))
         if caption:
-            data["caption"] = caption
-        
-        try:
-            response = requests.post(url, files=files, data=data)
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error sending document: {e}")
-            return {"ok": False}
+            form.add_field("caption", caption)
+        form.add_field("document", document_data, filename=filename, content_type=mime_type)
+        return await self._call("sendDocument", "sending document", data=form, timeout=120)
     
-    def get_file(self, file_id):
+    async def get_file(self, file_id):
         """Get file info"""
-        url = f"{self.base_url}/getFile"
-        params = {"file_id": file_id}
-        
-        try:
-            response = requests.get(url, params=params)
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"Error getting file info: {e}")
-            return {"ok": False}
+        return await self._call("getFile", "getting file info", params={"file_id": file_id})
     
-    def download_file(self, file_path):
+    async def download_file(self, file_path):
         """Download file from Telegram servers"""
-        url = f"https://api.telegram.org/file/bot{self.token}/{file_path}"
+        url = f"{self.api_url}/file/bot{self.token}/{file_path}"
         
         try:
-            response = requests.get(url)
-            return response.content
-        except requests.exceptions.RequestException as e:
+            async with self.get_session().get(url, timeout=aiohttp.ClientTimeout(total=60)) as response:
+                response.raise_for_status()
+                return await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
             print(f"Error downloading file: {e}")
             return None
 
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average and bursts of up to `capacity`"""
+    
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+    
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    async def acquire(self):
+        while True:
+            self.refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class OutboundScheduler:
+    """Sends through an AsyncTelegramBot within Telegram's rate limits
+    
+    Has the bot's sending methods. Each call first waits for its chat's
+    token bucket, then queues for the global one, where documents go ahead
+    of messages and messages ahead of edits. Answers with error_code 429 are
+    retried after the retry_after the server asks for, which pauses all
+    sends; network errors and 5xx answers are retried with backoff.
+    """
+    
+    DOCUMENT, MESSAGE, EDIT = 0, 1, 2
+    
+    def __init__(self, bot, global_rate=None, chat_rate=None, chat_burst=None, workers=4, retries=None):
+        self.bot = bot
+        self.global_bucket = TokenBucket(global_rate or TG_GLOBAL_RATE, 1)
+        self.chat_rate = chat_rate or TG_CHAT_RATE
+        self.chat_burst = chat_burst or TG_CHAT_BURST
+        self.chat_buckets = {}
+        self.retries = TG_SEND_RETRIES if retries is None else retries
+        self.queue = asyncio.PriorityQueue()
+        self.order = itertools.count()
+        self.paused_until = 0.0
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(workers)]
+    
+    def chat_bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self.chat_buckets) > 10000:
+                self._forget_idle_chats()
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+    
+    def _forget_idle_chats(self):
+        for chat_id, bucket in list(self.chat_buckets.items()):
+            bucket.refill()
+            if bucket.tokens >= bucket.capacity:
+                del self.chat_buckets[chat_id]
+    
+    async def send(self, priority, chat_id, method, *args):
+        await self.chat_bucket(chat_id).acquire()
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((priority, next(self.order), method, args, future))
+        return await future
+    
+    async def _worker(self):
+        while True:
+            _, _, method, args, future = await self.queue.get()
+            try:
+                result = await self._call(method, args)
+            except Exception as e:
+                print(f"Error in {method.__name__}: {e}")
+                result = {"ok": False}
+            if not future.done():
+                future.set_result(result)
+    
+    async def _call(self, method, args):
+        for attempt in range(self.retries + 1):
+            await asyncio.sleep(max(0.0, self.paused_until - time.monotonic()))
+            await self.global_bucket.acquire()
+            result = await method(*args)
+            if result.get("ok", False) or attempt == self.retries:
+                return result
+            
+            error_code = result.get("error_code")
+            if error_code == 429:
+                retry_after = result.get("parameters", {}).get("retry_after", 1)
+                print(f"Rate limited on {method.__name__}, retrying in {retry_after}s")
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+            elif error_code is None or error_code >= 500:
+                await asyncio.sleep(2 ** attempt)
+            else:
+                return result
+        return result
+    
+    async def send_message(self, chat_id, text):
+        return await self.send(self.MESSAGE, chat_id, self.bot.send_message, chat_id, text)
+    
+    async def edit_message_text(self, chat_id, message_id, text):
+        return await self.send(self.EDIT, chat_id, self.bot.edit_message_text, chat_id, message_id, text)
+    
+    async def send_document(self, chat_id, document_data, filename, caption=None, mime_type=None):
+        return await self.send(self.DOCUMENT, chat_id, self.bot.send_document,
+                               chat_id, document_data, filename, caption, mime_type)
+    
+    async def get_file(self, file_id):
+        return await self.bot.get_file(file_id)
+    
+    async def download_file(self, file_path):
+        return await self.bot.download_file(file_path)
+    
+    def close(self):
+        for worker in self.workers:
+            worker.cancel()
+
+class ChatStatus:
+    """A single progress message for one upload, edited in place
+    
+    Edits are coalesced so at most one goes out every `min_interval`
+    seconds however often the status changes in between.
+    """
+    
+    def __init__(self, bot, chat_id, min_interval=1.0):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.min_interval = min_interval
+        self.text = None
+        self.shown = None
+        self.message_id = None
+        self.pending = None
+        self.last_edit = 0.0
+    
+    def set(self, text):
+        self.text = text
+        if self.pending is None:
+            self.pending = asyncio.create_task(self._flush())
+    
+    async def _flush(self):
+        await asyncio.sleep(max(0.0, self.last_edit + self.min_interval - time.monotonic()))
+        self.pending = None
+        text = self.text
+        if text == self.shown:
+            return
+        self.last_edit = time.monotonic()
+        if self.message_id is None:
+            result = await self.bot.send_message(self.chat_id, text)
+            self.message_id = result.get("result", {}).get("message_id")
+        else:
+            await self.bot.edit_message_text(self.chat_id, self.message_id, text)
+        self.shown = text
+    
+    async def close(self, text):
+        """Show the final `text`, once any edit still in flight is done"""
+        self.text = text
+        if self.pending is not None:
+            await self.pending
+        await self._flush()
+
+def scaled_size(size, max_size=(64, 64)):
+    """The size compress_image() shrinks an image of `size` to"""
+    if size[0] <= max_size[0] and size[1] <= max_size[1]:
+        return size
+    
+    # Calculate the scaling factor to fit within max_size
+    scale_x = max_size[0] / size[0]
+    scale_y = max_size[1] / size[1]
+    scale = min(scale_x, scale_y)
+    
+    # Calculate new dimensions, keeping at least one pixel of very thin images (e.g. 8000x100)
+    return max(1, int(size[0] * scale)), max(1, int(size[1] * scale))
+
+def check_pixel_budget(size, max_pixels=None):
+    """Raise ValueError for an image whose header promises more pixels than we are willing to decode"""
+    max_pixels = max_pixels or TG_MAX_PIXELS
+    if size[0] * size[1] > max_pixels:
+        raise ValueError(f"Image is too large ({size[0]}x{size[1]}). Maximum is {max_pixels:,} pixels.")
+
 def compress_image(image, max_size=(64, 64)):
-    """Compress image to fit within max_size while maintaining aspect ratio"""
+    """Compress image to fit within max_size while maintaining aspect ratio
+    
+    Expects an image straight from Image.open(), of which only the header has
+    been read: its size is checked against the pixel budget before decoding,
+    and large images are first shrunk by cheap integer reduction before the
+    final LANCZOS pass.
+    """
     original_size = image.size
+    check_pixel_budget(original_size)
     
     # If image is already within limits, return as is
     if original_size[0] <= max_size[0] and original_size[1] <= max_size[1]:
         return image
     
-    # Calculate the scaling factor to fit within max_size
-    scale_x = max_size[0] / original_size[0]
-    scale_y = max_size[1] / original_size[1]
-    scale = min(scale_x, scale_y)
+    new_size = scaled_size(original_size, max_size)
+    
+    # Formats that support it (e.g. a JPEG renamed to .png) decode at reduced resolution
+    image.draft(None, new_size)
     
-    # Calculate new dimensions
-    new_width = int(original_size[0] * scale)
-    new_height = int(original_size[1] * scale)
+    # Palette and other modes would fall back to nearest-neighbour resampling
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    
+    # Premultiply alpha like Image.resize() does, so transparent pixels don't bleed into the
+    # edges; it would also ignore reducing_gap for RGBA, hence the explicit reduce() below
+    alpha = image.mode == 'RGBA'
+    if alpha:
+        image = image.convert('RGBa')
+    
+    # Cheap box reduction by an integer factor, leaving LANCZOS at least 3x to work with;
+    # measured on the current size, as draft() may already have shrunk the image
+    factor = min(image.size[0] // (new_size[0] * 3), image.size[1] // (new_size[1] * 3))
+    if factor > 1:
+        image = image.reduce(factor)
     
     # Resize the image using high-quality resampling
-    compressed_image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+    compressed_image = image.resize(new_size, Image.Resampling.LANCZOS)
+    if alpha:
+        compressed_image = compressed_image.convert('RGBA')
     
     print(f"Compressed image from {original_size} to {compressed_image.size}")
     return compressed_image
 
-def apply_column_saturation(image, num_columns, saturation_percent=100):
-    """Apply specified % black saturation to the last num_columns columns (right to left)"""
-    # Create a copy of the image
-    result_image = image.copy()
-    
-    # Convert to RGBA if not already
-    if result_image.mode != 'RGBA':
-        result_image = result_image.convert('RGBA')
+def darken_pixels(pixels, saturation_percent):
+    """Return a copy of an RGBA array with every non-transparent pixel darkened.
+
+    Matches the per-pixel loop exactly: each channel becomes int(c * (1 - factor)).
+    """
+    factor = 1 - saturation_percent / 100.0
+    darkened = pixels.copy()
+    visible = pixels[..., 3] > 0
+    darkened[visible, :3] = (pixels[visible, :3].astype(np.float64) * factor).astype(np.uint8)
+    return darkened
+
+def iter_column_frames(image, saturation_percent=100):
+    """Yield the column-wise saturated versions one at a time (right to left).
+
+    Each frame is the previous one with one more column darkened, so only a
+    single working frame is held however wide the image is.
+    """
+    # Convert to RGBA if needed
+    if image.mode != 'RGBA':
+        image = image.convert('RGBA')
     
-    # Get image dimensions
-    width, height = result_image.size
+    width, height = image.size
     
-    # Clamp num_columns to valid range
-    num_columns = min(num_columns, width)
+    if np is not None:
+        frame = np.array(image)
+        yield Image.fromarray(frame.copy())
+        for x in range(width - 1, -1, -1):
+            frame[:, x:x + 1] = darken_pixels(frame[:, x:x + 1], saturation_percent)
+            yield Image.fromarray(frame.copy())
+        return
     
-    # Calculate saturation factor (0.0 to 1.0)
     saturation_factor = saturation_percent / 100.0
-    
-    # Process each pixel in the image
-    pixels = result_image.load()
-    
-    for y in range(height):
-        # Process columns from right to left (last num_columns columns)
-        for x in range(width - num_columns, width):
+    working_image = image.copy()
+    pixels = working_image.load()
+    yield working_image.copy()
+    for x in range(width - 1, -1, -1):
+        for y in range(height):
             r, g, b, a = pixels[x, y]
-            
-            # Only process non-transparent pixels
             if a > 0:
-                # Apply saturation: interpolate between original color and black
-                new_r = int(r * (1 - saturation_factor))
-                new_g = int(g * (1 - saturation_factor))
-                new_b = int(b * (1 - saturation_factor))
-                
-                pixels[x, y] = (new_r, new_g, new_b, a)
-    
-    return result_image
+                pixels[x, y] = (int(r * (1 - saturation_factor)),
+                                int(g * (1 - saturation_factor)),
+                                int(b * (1 - saturation_factor)),
+                                a)
+        yield working_image.copy()
 
 def process_image_columns(image, saturation_percent=100):
     """Process image and create column-wise saturated versions (right to left)"""
-    # Convert to RGBA if needed
-    if image.mode != 'RGBA':
-        image = image.convert('RGBA')
-    
-    # Get image dimensions
-    width, height = image.size
-    
-    # Create list to store processed images
-    processed_images = []
-    
-    # Process each column step (0 to width)
-    for col in range(width + 1):  # +1 to include final state with all columns saturated
-        # Apply saturation to last 'col' columns (right to left)
-        processed_img = apply_column_saturation(image, col, saturation_percent)
-        processed_images.append(processed_img)
-    
-    return processed_images
+    return list(iter_column_frames(image, saturation_percent))
 
 def parse_saturation_command(text):
     """Parse saturation percentage from user message"""
@@ -193,33 +440,71 @@ def parse_saturation_command(text):
     
     return 100  # Default to 100% if no valid percentage found
 
-def image_to_bytes(image, optimize=True):
+def parse_mode_command(text):
+    """Return the output mode named by a "/mode <name>" message, None if it isn't one"""
+    parts = text.lower().split()
+    if not parts or parts[0] not in ("/mode", "mode"):
+        return None
+    if len(parts) < 2:
+        return ""
+    return parts[1]
+
+def image_to_bytes(image, optimize=True, compress_level=6):
     """Convert PIL Image to bytes with optional optimization"""
     img_byte_arr = io.BytesIO()
     
     # Save with optimization to reduce file size
-    save_params = {'format': 'PNG'}
+    save_params = {'format': 'PNG', 'compress_level': compress_level}
     if optimize:
         save_params['optimize'] = True
-        save_params['compress_level'] = 6  # Good balance between compression and speed
     
     image.save(img_byte_arr, **save_params)
     return img_byte_arr.getvalue()
 
-def create_zip_archive(processed_images, original_filename, compressed_size, saturation_percent):
-    """Create a ZIP archive containing all processed images"""
+def encode_frames(images, preset=None, workers=None):
+    """Encode images to PNG bytes on a thread pool, yielding them in order
+    
+    At most a couple of frames per worker are in flight, so a generator of
+    frames is still consumed lazily.
+    """
+    settings = PNG_PRESETS[preset or PNG_PRESET]
+    workers = workers or PNG_WORKERS
+    if workers <= 1:
+        for image in images:
+            yield image_to_bytes(image, **settings)
+        return
+    
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for image in images:
+            pending.append(pool.submit(image_to_bytes, image, **settings))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def create_zip_archive(processed_images, original_filename, compressed_size, saturation_percent, preset=None):
+    """Create a ZIP archive containing all processed images
+    
+    processed_images may be a generator such as iter_column_frames(); each
+    frame is then encoded and written to the archive as soon as it arrives.
+    The PNGs are stored as they are, deflating them a second time gains
+    next to nothing.
+    """
     zip_buffer = io.BytesIO()
+    if isinstance(processed_images, list):
+        frame_count = len(processed_images)
+    else:
+        frame_count = compressed_size[0] + 1
     
     with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED, compresslevel=6) as zip_file:
         # Add each processed image to the ZIP
-        for i, processed_img in enumerate(processed_images):
-            img_bytes = image_to_bytes(processed_img)
-            
+        for i, img_bytes in enumerate(encode_frames(processed_images, preset)):
             # Create filename for this image
-            filename = f"columns_{i:02d}_of_{len(processed_images)-1:02d}_{saturation_percent}pct.png"
+            filename = f"columns_{i:02d}_of_{frame_count-1:02d}_{saturation_percent}pct.png"
             
             # Add image to ZIP
-            zip_file.writestr(filename, img_bytes)
+            zip_file.writestr(filename, img_bytes, compress_type=zipfile.ZIP_STORED)
         
         # Create a readme file with information
         readme_content = f"""Column Saturation Images (Right to Left)
@@ -227,7 +512,7 @@ Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 Original file: {original_filename}
 Processed size: {compressed_size[0]}x{compressed_size[1]}
 Saturation level: {saturation_percent}%
-Total images: {len(processed_images)}
+Total images: {frame_count}
 
 File descriptions:
 - columns_00_of_XX_{saturation_percent}pct.png: Original image (0 columns affected)
@@ -244,207 +529,518 @@ Only non-transparent pixels are affected.
     zip_buffer.seek(0)
     return zip_buffer.getvalue()
 
-def main():
-    # Replace with your bot token
-    BOT_TOKEN = ""
+def create_atlas_png(processed_images, compressed_size, preset=None):
+    """Stack all frames into one vertical strip PNG, first frame at the top"""
+    width, height = compressed_size
+    frame_count = width + 1
+    atlas = Image.new('RGBA', (width, height * frame_count))
+    for i, processed_img in enumerate(processed_images):
+        atlas.paste(processed_img, (0, i * height))
+    return image_to_bytes(atlas, **PNG_PRESETS[preset or PNG_PRESET])
+
+def create_flipbook_json(texture_name, ticks_per_frame=1):
+    """flipbook_textures.json entry animating a block texture atlas created by create_atlas_png"""
+    return json.dumps([{
+        "flipbook_texture": f"textures/blocks/{texture_name}",
+        "atlas_tile": texture_name,
+        "ticks_per_frame": ticks_per_frame
+    }], indent=2)
+
+def create_apng(processed_images, frame_ms=None, preset=None):
+    """Encode all frames as one looping animated PNG
     
-    if BOT_TOKEN == "YOUR_BOT_TOKEN_HERE":
-        print("Please replace BOT_TOKEN with your actual bot token")
-        return
+    Pillow reads append_images more than once and holds every frame while
+    encoding anyway, so the frames are collected into a list first.
+    """
+    frames = list(processed_images)
+    settings = PNG_PRESETS[preset or PNG_PRESET]
+    img_byte_arr = io.BytesIO()
+    frames[0].save(img_byte_arr, format='PNG', save_all=True, append_images=frames[1:],
+                   duration=frame_ms or APNG_FRAME_MS, loop=0, **settings)
+    return img_byte_arr.getvalue()
+
+def render_output(mode, image, file_name, compressed_size, saturation_percent):
+    """Build the reply for one processed image in the given output mode
     
-    bot = TelegramBot(BOT_TOKEN)
+    Returns (data, filename, caption, mime_type, extra_text), where
+    extra_text is a follow-up message or None.
+    """
+    width, height = compressed_size
+    frame_count = width + 1
+    base_name = file_name.rsplit('.', 1)[0] if '.' in file_name else file_name
+    frames = iter_column_frames(image, saturation_percent)
     
-    print("Bot started. Waiting for messages...")
+    if mode in ("atlas", "flipbook"):
+        data = create_atlas_png(frames, compressed_size)
+        caption = (
+            f"🎞️ Sprite sheet (Right to Left)\n"
+            f"🖼️ {frame_count} frames of {width}x{height} pixels, stacked vertically\n"
+            f"🎛️ {saturation_percent}% saturation level"
+        )
+        extra_text = None
+        if mode == "flipbook":
+            extra_text = f"flipbook_textures.json:\n{create_flipbook_json(base_name)}"
+            if width != height:
+                extra_text += "\n\n⚠️ Minecraft expects square flipbook frames, this image is not square."
+        filename = f"{base_name}_atlas_{saturation_percent}pct_{width}x{height}.png"
+        return data, filename, caption, "image/png", extra_text
     
-    last_update_id = None
-    user_saturation = {}  # Store saturation settings per user
+    if mode == "apng":
+        data = create_apng(frames)
+        caption = (
+            f"🎬 Animated PNG (Right to Left)\n"
+            f"🖼️ Up to {frame_count} frames of {APNG_FRAME_MS} ms, identical frames are merged\n"
+            f"📏 {width}x{height} pixels\n"
+            f"🎛️ {saturation_percent}% saturation level"
+        )
+        filename = f"{base_name}_animated_{saturation_percent}pct_{width}x{height}.png"
+        return data, filename, caption, "image/png", None
     
-    while True:
+    # Generate frames with the user's saturation setting, streaming them into the ZIP
+    data = create_zip_archive(frames, file_name, compressed_size, saturation_percent)
+    caption = (
+        f"📁 Column Saturation Archive (Right to Left)\n"
+        f"🖼️ {frame_count} PNG images\n"
+        f"📏 {width}x{height} pixels\n"
+        f"🎛️ {saturation_percent}% saturation level\n"
+        f"📄 Includes README.txt with descriptions"
+    )
+    filename = f"{base_name}_column_saturation_{saturation_percent}pct_{width}x{height}.zip"
+    return data, filename, caption, "application/zip", None
+
+class ResultCache:
+    """LRU cache of rendered replies, in memory with an optional on-disk tier
+    
+    Values are render_output() tuples. The memory tier keeps at most
+    `max_entries` entries and `max_bytes` bytes of output; with a
+    `directory` every entry is also written there and the least recently
+    used files are deleted once they take up more than `disk_max_bytes`.
+    """
+    
+    def __init__(self, max_bytes, max_entries, directory=None, disk_max_bytes=0):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.directory = directory
+        self.disk_max_bytes = disk_max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+    
+    @staticmethod
+    def key(file_data, saturation_percent, target_size, output_mode, preset=None):
+        """Cache key: hash of the uploaded bytes plus every setting that changes the output"""
+        digest = hashlib.sha256(file_data).hexdigest()
+        return f"{digest}-{saturation_percent}-{target_size[0]}x{target_size[1]}-{output_mode}-{preset or PNG_PRESET}"
+    
+    def get(self, key):
+        """Return the cached render_output() tuple for `key`, or None"""
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+            value = self._disk_get(key)
+            if value is not None:
+                self.disk_hits += 1
+                self._remember(key, value)
+                return value
+            self.misses += 1
+            return None
+    
+    def put(self, key, value):
+        with self.lock:
+            self._remember(key, value)
+            self._disk_put(key, value)
+    
+    def _remember(self, key, value):
+        size = len(value[0])
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self.bytes -= len(self.entries.pop(key)[0])
+        self.entries[key] = value
+        self.bytes += size
+        while self.bytes > self.max_bytes or len(self.entries) > self.max_entries:
+            _, old = self.entries.popitem(last=False)
+            self.bytes -= len(old[0])
+            self.evictions += 1
+    
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + ".bin", base + ".json"
+    
+    def _disk_get(self, key):
+        if not self.directory:
+            return None
+        data_path, meta_path = self._paths(key)
         try:
-            # Get updates
-            updates = bot.get_updates(offset=last_update_id)
-            
-            if not updates.get("ok", False):
-                time.sleep(1)
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(data_path, 'rb') as f:
+                data = f.read()
+            os.utime(data_path)
+            os.utime(meta_path)
+        except (OSError, ValueError):
+            return None
+        return (data, meta["filename"], meta["caption"], meta["mime_type"], meta["extra_text"])
+    
+    def _disk_put(self, key, value):
+        if not self.directory:
+            return
+        data, filename, caption, mime_type, extra_text = value
+        data_path, meta_path = self._paths(key)
+        try:
+            with open(data_path, 'wb') as f:
+                f.write(data)
+            with open(meta_path, 'w', encoding='utf-8') as f:
+                json.dump({"filename": filename, "caption": caption,
+                           "mime_type": mime_type, "extra_text": extra_text}, f)
+            self._disk_evict(keep=key)
+        except OSError as e:
+            print(f"Error writing cache entry: {e}")
+    
+    def _disk_evict(self, keep):
+        entries = {}
+        for name in os.listdir(self.directory):
+            key, ext = os.path.splitext(name)
+            if ext not in (".bin", ".json"):
                 continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            size, used = entries.get(key, (0, 0))
+            entries[key] = (size + stat.st_size, max(used, stat.st_mtime))
+        
+        total = sum(size for size, _ in entries.values())
+        for key, (size, _) in sorted(entries.items(), key=lambda e: e[1][1]):
+            if total <= self.disk_max_bytes:
+                break
+            if key == keep:
+                continue
+            for path in self._paths(key):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+    
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+        }
+
+def process_document(file_data, file_name, saturation_percent, output_mode):
+    """Decode, compress and render one uploaded PNG; runs in a worker process"""
+    image = compress_image(Image.open(io.BytesIO(file_data)))
+    return render_output(output_mode, image, file_name, image.size, saturation_percent)
+
+class CpuPool:
+    """Process pool for the image work, replaced when one of its processes dies"""
+    
+    def __init__(self, workers):
+        self.workers = workers
+        self.pool = self._new_pool()
+    
+    def _new_pool(self):
+        # Never fork: the event loop and the encoder threads don't survive it
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+    
+    async def run(self, func, *args):
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.pool, func, *args)
+        except BrokenProcessPool:
+            self.pool.shutdown(wait=False)
+            self.pool = self._new_pool()
+            raise
+    
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+async def handle_message(bot, message, user_saturation, user_mode, cpu_pool, cache):
+    """Answer one message; runs as its own task so slow images don't hold up other chats"""
+    chat_id = message["chat"]["id"]
+    
+    # Handle text messages
+    if "text" in message:
+        text = message["text"]
+        
+        if text.lower() in ["/start", "/help"]:
+            help_text = (
+                "Welcome to the Enhanced Column Saturation Bot!\n\n"
+                "📋 Instructions:\n"
+                "1. Send me a PNG image as a DOCUMENT (not as photo!)\n"
+                "2. Images larger than 64x64 will be automatically compressed\n"
+                "3. I'll return a ZIP archive with all processed images\n\n"
+                "🎛️ Saturation Control:\n"
+                "• Default: 100% saturation (fully black)\n"
+                "• Custom: Send message with percentage before image\n"
+                "• Examples: '50%', '75 percent', 'saturation 30'\n"
+                "• Valid range: 1% to 100%\n\n"
+                "🔄 How it works:\n"
+                "Each image shows specified % saturation applied to columns from RIGHT TO LEFT:\n"
+                "• Image 1 = 0 columns affected (original)\n"
+                "• Image 2 = Rightmost column with X% saturation\n"
+                "• Image 3 = Last 2 columns with X% saturation\n"
+                "• ... and so on until all columns are saturated\n"
+                "• Only non-transparent pixels are affected\n\n"
+                "📦 Output Modes (/mode <name>):\n"
+                "• zip - ZIP archive with one PNG per frame (default)\n"
+                "• atlas - one vertical sprite-sheet PNG\n"
+                "• flipbook - sprite sheet plus flipbook_textures.json snippet\n"
+                "• apng - animated PNG\n\n"
+                "🗜️ Features:\n"
+                "• Automatic image compression for large images\n"
+                "• Aspect ratio is maintained\n"
+                "• High-quality resampling is used\n"
+                "• All images delivered in a single ZIP file\n"
+                "• Includes README.txt with file descriptions\n\n"
+                "⚠️ IMPORTANT: Send PNG as DOCUMENT, not as photo!\n"
+                "Photos are converted to JPEG and lose transparency."
+            )
+            await bot.send_message(chat_id, help_text)
+        elif parse_mode_command(text) is not None:
+            output_mode = parse_mode_command(text)
+            if output_mode in OUTPUT_MODES:
+                user_mode[chat_id] = output_mode
+                await bot.send_message(chat_id, 
+                    f"✅ Output mode set to {output_mode}: {OUTPUT_MODES[output_mode]}")
+            else:
+                await bot.send_message(chat_id, 
+                    f"📝 Current output mode: {user_mode.get(chat_id, 'zip')}\n"
+                    + "\n".join(f"• /mode {name} - {desc}" for name, desc in OUTPUT_MODES.items()))
+        else:
+            # Check if message contains saturation percentage
+            saturation_percent = parse_saturation_command(text)
+            if saturation_percent != 100:  # User specified a custom percentage
+                user_saturation[chat_id] = saturation_percent
+                await bot.send_message(chat_id, 
+                    f"✅ Saturation level set to {saturation_percent}%\n"
+                    f"Now send me a PNG image as a document to process!")
+            else:
+                # Reset to default if no valid percentage found
+                user_saturation[chat_id] = 100
+                await bot.send_message(chat_id, 
+                    f"📝 Current saturation: {user_saturation.get(chat_id, 100)}%\n"
+                    f"Send a percentage (e.g., '50%') to change, or send a PNG image to process.\n"
+                    f"Use /help for detailed instructions.")
+    
+    # Handle document messages (for PNG files)
+    elif "document" in message:
+        # Progress of this upload, shown as one message edited in place
+        status = ChatStatus(bot, chat_id)
+        try:
+            document = message["document"]
+            file_name = document.get("file_name", "")
+            file_size = document.get("file_size", 0)
+            mime_type = document.get("mime_type", "")
+            
+            # Check if it's a PNG file
+            if not (file_name.lower().endswith('.png') or mime_type == 'image/png'):
+                await bot.send_message(chat_id, "Error: Please send a PNG image as a document (not as a photo)")
+                return
             
-            for update in updates["result"]:
-                last_update_id = update["update_id"] + 1
+            # Check file size (optional, but good practice)
+            if file_size > 5 * 1024 * 1024:  # 5MB limit
+                await bot.send_message(chat_id, "Error: File too large. Maximum size is 5MB.")
+                return
+            
+            file_id = document["file_id"]
+            
+            # Get file info
+            file_info = await bot.get_file(file_id)
+            if not file_info.get("ok", False):
+                await bot.send_message(chat_id, "Error: Could not get file information")
+                return
+            
+            file_path = file_info["result"]["file_path"]
+            
+            # Download the file
+            file_data = await bot.download_file(file_path)
+            if not file_data:
+                await bot.send_message(chat_id, "Error: Could not download file")
+                return
+            
+            # Only read the size from the header here, decoding happens in a worker process
+            with Image.open(io.BytesIO(file_data)) as image:
+                original_size = image.size
+            check_pixel_budget(original_size)
+            compressed_size = scaled_size(original_size)
+            
+            # Get user's saturation setting (default to 100%)
+            saturation_percent = user_saturation.get(chat_id, 100)
+            
+            # Notify user about compression if it occurred
+            status_lines = []
+            if original_size != compressed_size:
+                status_lines.append(
+                    f"🗜️ Image compressed from {original_size[0]}x{original_size[1]} to {compressed_size[0]}x{compressed_size[1]}")
+            
+            output_mode = user_mode.get(chat_id, "zip")
+            frame_count = compressed_size[0] + 1
+            
+            # Reuse the reply built for the same file and settings earlier
+            cache_key = ResultCache.key(file_data, saturation_percent, compressed_size, output_mode)
+            cached = await asyncio.to_thread(cache.get, cache_key)
+            stats = cache.stats()
+            print(f"Result cache {'hit' if cached else 'miss'} for chat {chat_id} "
+                  f"({stats['hits'] + stats['disk_hits']} hits, {stats['misses']} misses, "
+                  f"{stats['entries']} entries, {stats['bytes']} bytes)")
+            
+            if cached:
+                data, out_filename, caption, out_mime, extra_text = cached
+            else:
+                status_lines.append(
+                    f"Processing {compressed_size[0]}x{compressed_size[1]} image with {saturation_percent}% saturation (right to left).\n"
+                    f"Creating {frame_count} variations as {OUTPUT_MODES[output_mode]}...")
+                status.set("\n".join(status_lines))
                 
-                # Skip if no message
-                if "message" not in update:
-                    continue
+                # Build the reply in the user's output mode
+                rendered = await cpu_pool.run(process_document, file_data, file_name, saturation_percent, output_mode)
+                await asyncio.to_thread(cache.put, cache_key, rendered)
+                data, out_filename, caption, out_mime, extra_text = rendered
+            
+            # Send the result
+            result = await bot.send_document(chat_id, data, out_filename, caption, out_mime)
+            
+            if result.get("ok", False):
+                if extra_text:
+                    await bot.send_message(chat_id, extra_text)
+                await status.close("\n".join(status_lines + [
+                    f"✅ Success! {OUTPUT_MODES[output_mode].capitalize()} with {frame_count} processed images.\n"
+                    f"📦 File size: {len(data)} bytes\n"
+                    f"🎛️ Saturation level: {saturation_percent}%\n"
+                    f"🔄 Direction: Right to Left\n"
+                    f"💬 Send a new percentage (e.g., '75%') to change saturation level, "
+                    f"or /mode to change the output format."]))
+            else:
+                await status.close("❌ Failed to send the result. Please try again.")
+                print(f"Failed to send {output_mode} output: {result}")
+            
+        except ValueError as e:
+            await status.close(f"Error: {str(e)}")
+        except Exception as e:
+            print(f"Error processing image: {e}")
+            await status.close("Error: Failed to process image. Please make sure it's a valid PNG file.")
+    
+    # Handle photo messages (inform user about document upload)
+    elif "photo" in message:
+        await bot.send_message(chat_id, 
+            "⚠️ Photos are automatically converted to JPEG by Telegram, which removes transparency.\n\n"
+            "Please send your PNG image as a DOCUMENT instead:\n"
+            "1. Click the 📎 attachment button\n"
+            "2. Select 'Document' (not 'Photo')\n"
+            "3. Choose your PNG file\n\n"
+            "This preserves the PNG format and transparency information."
+        )
+    
+    # Handle unsupported message types
+    else:
+        await bot.send_message(chat_id, 
+            "Please send a PNG image as a DOCUMENT or use /help for instructions.\n\n"
+            "⚠️ Don't send as photo - use the document attachment option to preserve PNG format!"
+        )
+
+async def run_in_order(previous, limit, handler):
+    """Await handler once the chat's previous update is done, holding one of `limit`'s slots"""
+    if previous is not None:
+        await asyncio.wait([previous])
+    async with limit:
+        try:
+            await handler
+        except Exception as e:
+            print(f"Error handling update: {e}")
+
+async def run_bot(bot):
+    print("Bot started. Waiting for messages...")
+    
+    # Stop cleanly on SIGTERM too (deploys, benchmarks/load_test.py), so the worker processes exit with us
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    except NotImplementedError:
+        pass  # Windows event loops have no signal handlers
+    
+    last_update_id = None
+    user_saturation = {}  # Store saturation settings per user
+    user_mode = {}  # Store output mode per user
+    chat_tasks = {}  # Last handler task per chat, the next update of that chat waits for it
+    outbound = OutboundScheduler(bot)
+    limit = asyncio.Semaphore(TG_MAX_CONCURRENT)
+    cpu_pool = CpuPool(TG_WORKERS)
+    cache = ResultCache(int(TG_CACHE_MB * 1024 * 1024), TG_CACHE_ENTRIES,
+                        TG_CACHE_DIR or None, int(TG_CACHE_DISK_MB * 1024 * 1024))
+    
+    def forget(chat_id, task):
+        if chat_tasks.get(chat_id) is task:
+            del chat_tasks[chat_id]
+    
+    try:
+        while True:
+            try:
+                # Get updates
+                updates = await bot.get_updates(offset=last_update_id)
                 
-                message = update["message"]
-                chat_id = message["chat"]["id"]
+                if not updates.get("ok", False):
+                    await asyncio.sleep(1)
+                    continue
                 
-                # Handle text messages
-                if "text" in message:
-                    text = message["text"]
+                for update in updates["result"]:
+                    last_update_id = update["update_id"] + 1
                     
-                    if text.lower() in ["/start", "/help"]:
-                        help_text = (
-                            "Welcome to the Enhanced Column Saturation Bot!\n\n"
-                            "📋 Instructions:\n"
-                            "1. Send me a PNG image as a DOCUMENT (not as photo!)\n"
-                            "2. Images larger than 64x64 will be automatically compressed\n"
-                            "3. I'll return a ZIP archive with all processed images\n\n"
-                            "🎛️ Saturation Control:\n"
-                            "• Default: 100% saturation (fully black)\n"
-                            "• Custom: Send message with percentage before image\n"
-                            "• Examples: '50%', '75 percent', 'saturation 30'\n"
-                            "• Valid range: 1% to 100%\n\n"
-                            "🔄 How it works:\n"
-                            "Each image shows specified % saturation applied to columns from RIGHT TO LEFT:\n"
-                            "• Image 1 = 0 columns affected (original)\n"
-                            "• Image 2 = Rightmost column with X% saturation\n"
-                            "• Image 3 = Last 2 columns with X% saturation\n"
-                            "• ... and so on until all columns are saturated\n"
-                            "• Only non-transparent pixels are affected\n\n"
-                            "🗜️ Features:\n"
-                            "• Automatic image compression for large images\n"
-                            "• Aspect ratio is maintained\n"
-                            "• High-quality resampling is used\n"
-                            "• All images delivered in a single ZIP file\n"
-                            "• Includes README.txt with file descriptions\n\n"
-                            "⚠️ IMPORTANT: Send PNG as DOCUMENT, not as photo!\n"
-                            "Photos are converted to JPEG and lose transparency."
-                        )
-                        bot.send_message(chat_id, help_text)
-                    else:
-                        # Check if message contains saturation percentage
-                        saturation_percent = parse_saturation_command(text)
-                        if saturation_percent != 100:  # User specified a custom percentage
-                            user_saturation[chat_id] = saturation_percent
-                            bot.send_message(chat_id, 
-                                f"✅ Saturation level set to {saturation_percent}%\n"
-                                f"Now send me a PNG image as a document to process!")
-                        else:
-                            # Reset to default if no valid percentage found
-                            user_saturation[chat_id] = 100
-                            bot.send_message(chat_id, 
-                                f"📝 Current saturation: {user_saturation.get(chat_id, 100)}%\n"
-                                f"Send a percentage (e.g., '50%') to change, or send a PNG image to process.\n"
-                                f"Use /help for detailed instructions.")
-                
-                # Handle document messages (for PNG files)
-                elif "document" in message:
-                    try:
-                        document = message["document"]
-                        file_name = document.get("file_name", "")
-                        file_size = document.get("file_size", 0)
-                        mime_type = document.get("mime_type", "")
-                        
-                        # Check if it's a PNG file
-                        if not (file_name.lower().endswith('.png') or mime_type == 'image/png'):
-                            bot.send_message(chat_id, "Error: Please send a PNG image as a document (not as a photo)")
-                            continue
-                        
-                        # Check file size (optional, but good practice)
-                        if file_size > 5 * 1024 * 1024:  # 5MB limit
-                            bot.send_message(chat_id, "Error: File too large. Maximum size is 5MB.")
-                            continue
-                        
-                        file_id = document["file_id"]
-                        
-                        # Get file info
-                        file_info = bot.get_file(file_id)
-                        if not file_info.get("ok", False):
-                            bot.send_message(chat_id, "Error: Could not get file information")
-                            continue
-                        
-                        file_path = file_info["result"]["file_path"]
-                        
-                        # Download the file
-                        file_data = bot.download_file(file_path)
-                        if not file_data:
-                            bot.send_message(chat_id, "Error: Could not download file")
-                            continue
-                        
-                        # Open image with PIL
-                        image = Image.open(io.BytesIO(file_data))
-                        original_size = image.size
-                        
-                        # Compress image if needed
-                        image = compress_image(image)
-                        compressed_size = image.size
-                        
-                        # Get user's saturation setting (default to 100%)
-                        saturation_percent = user_saturation.get(chat_id, 100)
-                        
-                        # Notify user about compression if it occurred
-                        if original_size != compressed_size:
-                            bot.send_message(chat_id, 
-                                f"🗜️ Image compressed from {original_size[0]}x{original_size[1]} to {compressed_size[0]}x{compressed_size[1]}")
-                        
-                        bot.send_message(chat_id, 
-                            f"Processing {compressed_size[0]}x{compressed_size[1]} image with {saturation_percent}% saturation (right to left).\n"
-                            f"Creating {compressed_size[0] + 1} variations and compressing to ZIP...")
-                        
-                        # Process the image with user's saturation setting
-                        processed_images = process_image_columns(image, saturation_percent)
-                        
-                        # Create ZIP archive with all processed images
-                        zip_data = create_zip_archive(processed_images, file_name, compressed_size, saturation_percent)
-                        
-                        # Create ZIP filename
-                        base_name = file_name.rsplit('.', 1)[0] if '.' in file_name else file_name
-                        zip_filename = f"{base_name}_column_saturation_{saturation_percent}pct_{compressed_size[0]}x{compressed_size[1]}.zip"
-                        
-                        # Create caption for the ZIP file
-                        zip_caption = (
-                            f"📁 Column Saturation Archive (Right to Left)\n"
-                            f"🖼️ {len(processed_images)} PNG images\n"
-                            f"📏 {compressed_size[0]}x{compressed_size[1]} pixels\n"
-                            f"🎛️ {saturation_percent}% saturation level\n"
-                            f"📄 Includes README.txt with descriptions"
-                        )
-                        
-                        # Send the ZIP file
-                        result = bot.send_document(chat_id, zip_data, zip_filename, zip_caption, "application/zip")
-                        
-                        if result.get("ok", False):
-                            bot.send_message(chat_id, 
-                                f"✅ Success! ZIP archive contains {len(processed_images)} processed images.\n"
-                                f"📦 File size: {len(zip_data)} bytes\n"
-                                f"🎛️ Saturation level: {saturation_percent}%\n"
-                                f"🔄 Direction: Right to Left\n"
-                                f"💡 Extract the ZIP to access all images and the README file.\n\n"
-                                f"💬 Send a new percentage (e.g., '75%') to change saturation level.")
-                        else:
-                            bot.send_message(chat_id, "❌ Failed to send ZIP archive. Please try again.")
-                            print(f"Failed to send ZIP file: {result}")
-                        
-                    except ValueError as e:
-                        bot.send_message(chat_id, f"Error: {str(e)}")
-                    except Exception as e:
-                        print(f"Error processing image: {e}")
-                        bot.send_message(chat_id, "Error: Failed to process image. Please make sure it's a valid PNG file.")
-                
-                # Handle photo messages (inform user about document upload)
-                elif "photo" in message:
-                    bot.send_message(chat_id, 
-                        "⚠️ Photos are automatically converted to JPEG by Telegram, which removes transparency.\n\n"
-                        "Please send your PNG image as a DOCUMENT instead:\n"
-                        "1. Click the 📎 attachment button\n"
-                        "2. Select 'Document' (not 'Photo')\n"
-                        "3. Choose your PNG file\n\n"
-                        "This preserves the PNG format and transparency information."
-                    )
-                
-                # Handle unsupported message types
-                else:
-                    bot.send_message(chat_id, 
-                        "Please send a PNG image as a DOCUMENT or use /help for instructions.\n\n"
-                        "⚠️ Don't send as photo - use the document attachment option to preserve PNG format!"
-                    )
-        
-        except KeyboardInterrupt:
-            print("\nBot stopped by user")
-            break
-        except Exception as e:
-            print(f"Unexpected error: {e}")
-            time.sleep(5)
+                    # Skip if no message
+                    if "message" not in update:
+                        continue
+                    
+                    message = update["message"]
+                    chat_id = message["chat"]["id"]
+                    handler = handle_message(outbound, message, user_saturation, user_mode, cpu_pool, cache)
+                    task = asyncio.create_task(run_in_order(chat_tasks.get(chat_id), limit, handler))
+                    chat_tasks[chat_id] = task
+                    task.add_done_callback(lambda task, chat_id=chat_id: forget(chat_id, task))
+            
+            except Exception as e:
+                print(f"Unexpected error: {e}")
+                await asyncio.sleep(5)
+    finally:
+        outbound.close()
+        cpu_pool.shutdown()
+        await bot.close()
+
+def main():
+    # Replace with your bot token, or set TELEGRAM_TOKEN
+    BOT_TOKEN = os.getenv("TELEGRAM_TOKEN", "")
+    
+    if BOT_TOKEN == "YOUR_BOT_TOKEN_HERE":
+        print("Please replace BOT_TOKEN with your actual bot token")
+        return
+    
+    if PNG_PRESET not in PNG_PRESETS:
+        print(f"Unknown PNG_PRESET {PNG_PRESET!r}, use one of: {', '.join(PNG_PRESETS)}")
+        return
+    
+    # TELEGRAM_API_URL points the bot at another Bot API server, e.g. benchmarks/fake_telegram.py
+    bot = AsyncTelegramBot(BOT_TOKEN, api_url=os.getenv("TELEGRAM_API_URL", "https://api.telegram.org"))
+    
+    try:
+        asyncio.run(run_bot(bot))
+    except KeyboardInterrupt:
+        print("\nBot stopped by user")
+    except asyncio.CancelledError:
+        print("\nBot stopped")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
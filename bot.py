@@ -1,146 +1,404 @@
 import os
+import asyncio
 import discord
-import zipfile
+import aiohttp
 import tempfile
-import shutil
-import json
+import time
 from dotenv import load_dotenv
+from workers import JobQueue, QueueFull
+from addon_cache import AddonCache
+from metrics import Registry, JobMetrics
+from ingest import AttachmentTooLarge, SpooledBuffer, Workspace, download
+from job_store import SqliteJobQueue, default_path as default_job_db
+from fixer import (ADDON_EXTENSIONS, VERSION, build_delta, count_files, delta_name_for, engine,
+                   fixed_name_for, run_fix_job)
 
 # Load .env token
 load_dotenv()
 TOKEN = os.getenv("DISCORD_TOKEN")
 
+# "single": one process with its own worker pool.
+# "gateway": an auto-sharded gateway only, job_worker.py processes do the fixing.
+DEPLOY_MODE = os.getenv("DEPLOY_MODE", "single")
+
 intents = discord.Intents.default()
 intents.message_content = True
-client = discord.Client(intents=intents)
 
+if DEPLOY_MODE == "gateway":
+    shard_ids = os.getenv("SHARD_IDS")
+    client = discord.AutoShardedClient(
+        intents=intents,
+        shard_count=int(os.getenv("SHARD_COUNT", "0")) or None,
+        shard_ids=[int(shard) for shard in shard_ids.split(",")] if shard_ids else None,
+    )
+    jobs = SqliteJobQueue(default_job_db(), max_queued=int(os.getenv("JOB_QUEUE_SIZE", "50")),
+                          job_timeout=float(os.getenv("JOB_TIMEOUT", "1800")))
+else:
+    client = discord.Client(intents=intents)
+    # Addon processing runs in a process pool so the gateway heartbeat never stalls
+    jobs = JobQueue(
+        pool_size=int(os.getenv("WORKER_POOL_SIZE", "0")) or None,
+        max_queued=int(os.getenv("JOB_QUEUE_SIZE", "50")),
+        per_user=int(os.getenv("JOBS_PER_USER", "1")),
+        per_guild=int(os.getenv("JOBS_PER_GUILD", "2")),
+    )
+
+cache = AddonCache(
+    os.getenv("CACHE_DIR", os.path.join(tempfile.gettempdir(), "mcaddon-cache")),
+    max_bytes=int(os.getenv("CACHE_MAX_MB", "1024")) * 1024 * 1024,
+    version=VERSION,
+)
+
+# Uploads are buffered in memory up to SPOOL_MAX_MB and spill into a per-job workspace above it
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "256")) * 1024 * 1024
+SPOOL_MAX_BYTES = int(os.getenv("SPOOL_MAX_MB", "32")) * 1024 * 1024
+WORKSPACE_ROOT = os.getenv("WORKSPACE_DIR") or None
+http_session = None
+
+# What replies contain unless the message asks otherwise: "full" fixed archives, "delta" only
+# the modified files plus a manifest, or "auto" the full archive if it fits and the delta if not
+REPLY_MODES = ("full", "delta", "auto")
+REPLY_MODE = os.getenv("REPLY_MODE", "full")
+
+metrics = Registry()
+stage_seconds = metrics.histogram("mcaddon_stage_seconds", "Seconds spent in each stage of an upload job")
+jobs_total = metrics.counter("mcaddon_jobs_total", "Finished upload jobs by result")
+bytes_total = metrics.counter("mcaddon_bytes_total", "Archive bytes read and written by direction")
+files_modified_total = metrics.counter("mcaddon_files_modified_total", "JSON files rewritten by the fix rules")
+metrics.gauge("mcaddon_queue_jobs", "Jobs running in or waiting for the worker pool",
+              lambda: [({"state": "running"}, jobs.running), ({"state": "waiting"}, len(jobs.pending))])
+metrics.callback_counter("mcaddon_cache_events_total", "Result cache lookups and evictions since start",
+              lambda: [({"event": name}, cache.stats()[name]) for name in ("hits", "misses", "evictions")])
+metrics_server = None
+
+
+def finish_job(job_metrics, result):
+    jobs_total.inc(result=result)
+    job_metrics.finish(result)
+
+
+class StatusMessage:
+    """A single progress message for all addons in an upload, edited in place.
+
+    Edits are coalesced so that at most one goes out every `min_interval`
+    seconds however many attachments change state in between. Failing to
+    send or edit it (e.g. it was deleted) is logged and never stops the
+    upload itself.
+    """
+
+    def __init__(self, channel, names, min_interval=1.0):
+        self.channel = channel
+        # One line per attachment by position, as two attachments may share a name
+        self.names = list(names)
+        self.states = ["⏬ Downloading..."] * len(self.names)
+        self.min_interval = min_interval
+        self.message = None
+        self.pending = None
+        self.last_edit = 0.0
+
+    def render(self):
+        return "\n".join(f"`{name}`: {state}" for name, state in zip(self.names, self.states))
+
+    async def start(self):
+        try:
+            self.message = await self.channel.send(self.render())
+        except discord.HTTPException as e:
+            print(f"[WARN] Could not send the status message: {e}")
+        self.last_edit = time.monotonic()
+
+    async def _edit(self):
+        if self.message is None:
+            return
+        try:
+            await self.message.edit(content=self.render())
+        except discord.HTTPException as e:
+            print(f"[WARN] Could not update the status message: {e}")
+
+    def set(self, slot, state):
+        self.states[slot] = state
+        if self.pending is None:
+            self.pending = asyncio.create_task(self._flush())
 
-def fix_tags_in_file(filepath):
+    async def _flush(self):
+        await asyncio.sleep(max(0.0, self.last_edit + self.min_interval - time.monotonic()))
+        self.pending = None
+        self.last_edit = time.monotonic()
+        await self._edit()
+
+    async def close(self):
+        if self.pending is not None:
+            self.pending.cancel()
+            self.pending = None
+        await self._edit()
+
+
+def get_http_session():
+    global http_session
+    if http_session is None or http_session.closed:
+        http_session = aiohttp.ClientSession()
+    return http_session
+
+
+async def fix_attachment(message, attachment, status, slot):
+    """Download, fix and cache one attachment, return a result dict for the combined reply.
+
+    Errors are reported on the attachment's own status line (`slot`) so they
+    don't take down the other attachments of the message.
+    """
+    name = attachment.filename
+    guild_id = message.guild.id if message.guild else None
+    job_metrics = JobMetrics(stage_seconds, file=name, user=message.author.id, guild=guild_id)
+    result = {"file": name, "fixed_name": fixed_name_for(name), "fixed_path": None,
+              "summaries": [], "metrics": job_metrics, "cache_key": None}
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-    except Exception:
-        return None  # Not a valid JSON
+        return await process_attachment(message, attachment, status, slot, result)
+    except Exception as e:
+        print(f"[ERROR] Failed to fix {name}: {e}")
+        status.set(slot, "❌ Failed to fix the addon.")
+        result["fixed_path"] = None
+        if job_metrics.result is None:
+            finish_job(job_metrics, "error")
+        return result
 
-    item = data.get("minecraft:item")
-    if not item:
-        return None
 
-    components = item.get("components", {})
-    if not isinstance(components, dict):
-        return None
+async def process_attachment(message, attachment, status, slot, result):
+    """The steps of fix_attachment, filling in and returning `result`"""
+    name = result["file"]
+    guild_id = message.guild.id if message.guild else None
+    job_metrics = result["metrics"]
 
-    broken_tags = [k for k, v in components.items() if k.startswith("tag:") and v == {}]
-    if not broken_tags:
-        return None
+    if attachment.size > MAX_UPLOAD_BYTES:
+        status.set(slot, f"❌ Too large, the limit is {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.")
+        finish_job(job_metrics, "too_large")
+        return result
 
-    tag_list = [tag[4:] for tag in broken_tags]
+    with Workspace(WORKSPACE_ROOT) as workspace:
+        buffer = SpooledBuffer(workspace.file(name), SPOOL_MAX_BYTES)
+        try:
+            with job_metrics.stage("download"):
+                await download(get_http_session(), attachment.url, buffer, MAX_UPLOAD_BYTES)
+        except AttachmentTooLarge:
+            buffer.close()
+            status.set(slot, f"❌ Too large, the limit is {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.")
+            finish_job(job_metrics, "too_large")
+            return result
+        except Exception as e:
+            buffer.close()
+            print(f"[ERROR] Failed to download {name}: {e}")
+            status.set(slot, "❌ Download failed.")
+            finish_job(job_metrics, "error")
+            return result
 
-    for tag in broken_tags:
-        components.pop(tag)
+        cache_key = cache.key_for(buffer.sha256.hexdigest())
+        cached = cache.get(cache_key)
+        job_metrics.set(cache="hit" if cached else "miss", spilled=not buffer.in_memory)
+        print(f"[CACHE] {'hit' if cached else 'miss'} for {name} {cache.stats()}")
 
-    if "minecraft:tags" in components:
-        existing_tags = components["minecraft:tags"].get("tags", [])
-        if isinstance(existing_tags, list):
-            components["minecraft:tags"]["tags"] = list(set(existing_tags + tag_list))
+        if cached:
+            fixed_path, summaries = cached
+            result["cache_key"] = cache_key
+            stats = {
+                "bytes_in": buffer.size,
+                "bytes_out": os.path.getsize(fixed_path),
+                "files_modified": count_files(summaries),
+            }
         else:
-            components["minecraft:tags"]["tags"] = tag_list
-    else:
-        components["minecraft:tags"] = {"tags": tag_list}
+            try:
+                source = buffer.source() if jobs.accepts_bytes else buffer.to_path()
+                job = await jobs.submit(message.author.id, guild_id, run_fix_job,
+                                  source, workspace.file(result["fixed_name"]))
+            except QueueFull:
+                status.set(slot, "🚦 The fixer is busy right now, please try again in a few minutes.")
+                finish_job(job_metrics, "busy")
+                return result
 
-    try:
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2)
-        return {
-            "file": os.path.basename(filepath),
-            "tags_added": tag_list
-        }
-    except Exception:
+            if job.position:
+                status.set(slot, f"⏳ Queued, position {job.position}...")
+            else:
+                status.set(slot, "🛠 Fixing broken tags...")
+
+            try:
+                fixed_path, summaries, stats = await job
+            except Exception as e:
+                print(f"[ERROR] Failed to process {name}: {e}")
+                status.set(slot, "❌ Failed to fix the addon.")
+                job_metrics.add_stage("queue_wait", job.queue_wait)
+                finish_job(job_metrics, "error")
+                return result
+
+            job_metrics.add_stage("queue_wait", job.queue_wait)
+            for stage, seconds in stats.pop("stages").items():
+                job_metrics.add_stage(stage, seconds)
+
+            if os.path.exists(fixed_path):
+                fixed_path = await asyncio.to_thread(cache.put, cache_key, fixed_path, summaries)
+                result["cache_key"] = cache_key
+
+    if not os.path.exists(fixed_path):
+        status.set(slot, "❌ Failed to fix the addon.")
+        finish_job(job_metrics, "error")
+        return result
+
+    job_metrics.set(**stats)
+    bytes_total.inc(stats["bytes_in"], direction="in")
+    bytes_total.inc(stats["bytes_out"], direction="out")
+    files_modified_total.inc(stats["files_modified"])
+
+    count = count_files(summaries)
+    status.set(slot, f"✅ Fixed {count} file{'s' if count != 1 else ''}" if count else "✅ Nothing to fix")
+    result.update(fixed_path=fixed_path, summaries=summaries)
+    return result
+
+
+def build_summary_embed(results):
+    """One embed summarising the fixes of every addon in the upload"""
+    fixed = [r for r in results if r["summaries"]]
+    if not fixed:
         return None
 
+    embed = discord.Embed(
+        title="✅ Addon Fixed",
+        description="\n".join(f"**File:** `{r['file']}`  **Modified Files:** `{count_files(r['summaries'])}`"
+                              for r in fixed),
+        color=0x00ff80
+    )
 
-def process_mcaddon(file_path):
-    temp_dir = tempfile.mkdtemp()
-    fixed_path = file_path.replace(".mcaddon", "_fixed.mcaddon")
-    summaries = []
+    total_chars = len(embed.description)
+    max_embed_chars = 5900  # leave room for Discord's limit
+    max_fields = 10  # Show at most 10 files
+    cutoff = False
+
+    summaries = [(r["file"], summary) for r in fixed for summary in r["summaries"]]
+    for addon, summary in summaries[:max_fields]:
+        file = f"{addon}/{summary['file']}" if len(fixed) > 1 else summary["file"]
+        changes = summary["changes"]
+        change_list = '\n'.join(f"• `{change}`" for change in changes)
+        if total_chars + len(file) + len(change_list) > max_embed_chars:
+            cutoff = True
+            break
+        label = engine.label(summary["rule"])
+        embed.add_field(
+            name=f"🧩 `{file}` ({len(changes)} {label}{'s' if len(changes) != 1 else ''})",
+            value=change_list,
+            inline=False
+        )
+        total_chars += len(file) + len(change_list)
+
+    if cutoff or len(summaries) > max_fields:
+        embed.set_footer(text="⚠️ Truncated summary due to Discord embed limits.")
+
+    return embed
+
+
+def reply_mode_for(message):
+    """The reply mode named in the message text (e.g. `delta` or `!auto`), else REPLY_MODE"""
+    for word in message.content.lower().split():
+        word = word.lstrip("!-/")
+        if word in REPLY_MODES:
+            return word
+    return REPLY_MODE
+
+
+def use_delta(result, mode, size_limit):
+    return mode == "delta" or (mode == "auto" and os.path.getsize(result["fixed_path"]) > size_limit)
 
-    try:
-        with zipfile.ZipFile(file_path, 'r') as zip_ref:
-            zip_ref.extractall(temp_dir)
-
-        for root, _, files in os.walk(temp_dir):
-            if "items" in root:
-                for file in files:
-                    if file.endswith(".json"):
-                        result = fix_tags_in_file(os.path.join(root, file))
-                        if result:
-                            summaries.append(result)
-
-        with zipfile.ZipFile(fixed_path, 'w', zipfile.ZIP_DEFLATED) as zip_out:
-            for root, _, files in os.walk(temp_dir):
-                for file in files:
-                    abs_path = os.path.join(root, file)
-                    rel_path = os.path.relpath(abs_path, temp_dir)
-                    zip_out.write(abs_path, rel_path)
-
-        return fixed_path, summaries
-    finally:
-        shutil.rmtree(temp_dir)
+
+def batch_files(results, size_limit, max_files=10):
+    """Group fixed archives into as few messages as Discord's per-message limits allow"""
+    batches = []
+    batch, batch_size = [], 0
+    for result in results:
+        size = os.path.getsize(result["fixed_path"])
+        if batch and (len(batch) >= max_files or batch_size + size > size_limit):
+            batches.append(batch)
+            batch, batch_size = [], 0
+        batch.append(result)
+        batch_size += size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+async def send_results(message, results):
+    """Reply with the fixed archives (or their deltas) and the summary embed"""
+    done = [r for r in results if r["fixed_path"]]
+    if not done:
+        return
+
+    embed = build_summary_embed(done)
+    size_limit = message.guild.filesize_limit if message.guild else 25 * 1024 * 1024
+    mode = reply_mode_for(message)
+    with Workspace(WORKSPACE_ROOT) as workspace:
+        for index, r in enumerate(done):
+            if use_delta(r, mode, size_limit):
+                # Send the small archive of changed files in place of the full one
+                start = time.perf_counter()
+                r["fixed_name"] = delta_name_for(r["fixed_name"])
+                # Attachments of one message may share a name, so each delta gets its own directory
+                delta_path = workspace.file(r["fixed_name"], subdir=index)
+                r["fixed_path"] = await asyncio.to_thread(
+                    build_delta, r["fixed_path"], r["summaries"], delta_path, r["file"])
+                r["delta"] = True
+                r["metrics"].add_stage("delta", time.perf_counter() - start)
+
+        for batch in batch_files(done, size_limit):
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                files = [discord.File(r["fixed_path"], filename=r["fixed_name"]) for r in batch]
+                content = "📦 Here's your fixed addon:" if len(done) == 1 else "📦 Here are your fixed addons:"
+                if any(r.get("delta") for r in batch):
+                    content += "\n🧩 `_delta.zip` files only hold the modified files, see their `manifest.json`."
+                if embed is not None:
+                    await message.reply(content, embed=embed, files=files)
+                    embed = None
+                else:
+                    await message.reply(content, files=files)
+                outcome = "ok"
+            finally:
+                seconds = time.perf_counter() - start
+                for r in batch:
+                    r["metrics"].add_stage("upload", seconds)
+                    finish_job(r["metrics"], outcome)
 
 
 @client.event
 async def on_ready():
+    global metrics_server
     print(f"[READY] Bot is logged in as {client.user}")
 
+    port = int(os.getenv("METRICS_PORT", "9108"))
+    if port and metrics_server is None:
+        metrics_server = await metrics.serve(os.getenv("METRICS_HOST", "127.0.0.1"), port)
+        print(f"[METRICS] Serving on port {port}")
+
 
 @client.event
 async def on_message(message):
     if message.author.bot:
         return
 
-    for attachment in message.attachments:
-        if attachment.filename.endswith(".mcaddon"):
-            await message.channel.send(f"🔧 Downloading `{attachment.filename}`...")
-            temp_input = os.path.join(tempfile.gettempdir(), attachment.filename)
-            await attachment.save(temp_input)
+    attachments = [a for a in message.attachments if a.filename.lower().endswith(ADDON_EXTENSIONS)]
+    if not attachments:
+        return
 
-            await message.channel.send("🛠 Fixing broken tags...")
-            fixed_path, summaries = process_mcaddon(temp_input)
+    status = StatusMessage(message.channel, [a.filename for a in attachments])
+    await status.start()
 
-            if os.path.exists(fixed_path):
-                if summaries:
-                    embed = discord.Embed(
-                        title="✅ Addon Tags Fixed",
-                        description=f"**File:** `{attachment.filename}`\n**Modified Files:** `{len(summaries)}`",
-                        color=0x00ff80
-                    )
-
-                    total_chars = len(embed.description)
-                    max_embed_chars = 5900  # leave room for Discord's limit
-                    max_fields = 10  # Show at most 10 files
-                    cutoff = False
-
-                    for summary in summaries[:max_fields]:
-                        tag_list = '\n'.join(f"• `{tag}`" for tag in summary["tags_added"])
-                        if total_chars + len(summary["file"]) + len(tag_list) > max_embed_chars:
-                            cutoff = True
-                            break
-                        embed.add_field(
-                            name=f"🧩 `{summary['file']}` ({len(summary['tags_added'])} tag{'s' if len(summary['tags_added']) != 1 else ''})",
-                            value=tag_list,
-                            inline=False
-                        )
-                        total_chars += len(summary["file"]) + len(tag_list)
-
-                    if cutoff or len(summaries) > max_fields:
-                        embed.set_footer(text="⚠️ Truncated summary due to Discord embed limits.")
-
-                    await message.channel.send(embed=embed)
-
-                await message.channel.send("📦 Here's your fixed addon:",
-                                         file=discord.File(fixed_path))
-                os.remove(fixed_path)
-            else:
-                await message.channel.send("❌ Failed to fix the addon.")
-                
-client.run(TOKEN)
+    results = await asyncio.gather(*(fix_attachment(message, a, status, slot)
+                                     for slot, a in enumerate(attachments)))
+    try:
+        await status.close()
+        await send_results(message, results)
+    finally:
+        for r in results:
+            # A job the reply never got to still counts, as an error
+            if r["metrics"].result is None:
+                finish_job(r["metrics"], "error")
+            # The cached archives may be evicted once the reply is out
+            if r["cache_key"] is not None:
+                cache.release(r["cache_key"])
+
+
+if __name__ == "__main__":
+    client.run(TOKEN)
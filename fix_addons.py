@@ -0,0 +1,137 @@
+"""Fix every addon below a directory without going through Discord.
+
+    python fix_addons.py addons/ fixed/ --report report.jsonl
+    python fix_addons.py addons/ fixed/ --jobs 8 --force
+
+The output tree mirrors the input tree. An addon is skipped when its output
+exists and was produced from the same input by the same fixer version.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from fixer import ADDON_EXTENSIONS, VERSION, count_files, process_mcaddon
+
+# Remembers which input and fixer version produced each output
+STATE_FILE = ".fix_addons_state.json"
+
+
+def find_addons(input_dir):
+    for root, _, files in os.walk(input_dir):
+        for file in sorted(files):
+            if file.lower().endswith(ADDON_EXTENSIONS):
+                yield os.path.relpath(os.path.join(root, file), input_dir)
+
+
+def input_signature(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime, "version": VERSION}
+
+
+def load_state(output_dir):
+    try:
+        with open(os.path.join(output_dir, STATE_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(output_dir, state):
+    path = os.path.join(output_dir, STATE_FILE)
+    with open(path + ".tmp", 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(path + ".tmp", path)
+
+
+def fix_one(input_path, output_path, stream=True):
+    """Fix one addon into `output_path`, return its report record"""
+    start = time.perf_counter()
+    record = {"input": input_path, "output": output_path}
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    partial_path = output_path + ".partial"
+
+    try:
+        stats = {}
+        _, summaries = process_mcaddon(input_path, stream=stream, stats=stats, fixed_path=partial_path)
+        os.replace(partial_path, output_path)
+    except Exception as e:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        record.update(status="error", error=f"{type(e).__name__}: {e}",
+                      seconds=time.perf_counter() - start)
+        return record
+
+    record.update(
+        status="fixed" if summaries else "unchanged",
+        files_modified=count_files(summaries),
+        bytes_in=stats["bytes_in"],
+        bytes_out=stats["bytes_out"],
+        stages=stats["stages"],
+        seconds=time.perf_counter() - start,
+        summaries=summaries,
+    )
+    return record
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fix every addon below a directory")
+    parser.add_argument("input_dir")
+    parser.add_argument("output_dir")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--report", help="write one JSON line per addon to this file")
+    parser.add_argument("--force", action="store_true", help="re-fix addons whose output is up to date")
+    parser.add_argument("--extract", action="store_true", help="use the extract-to-disk path instead of streaming")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    state = load_state(args.output_dir)
+    report = open(args.report, 'w', encoding='utf-8') if args.report else None
+    counts = {}
+
+    def emit(record):
+        counts[record["status"]] = counts.get(record["status"], 0) + 1
+        if report:
+            report.write(json.dumps(record) + "\n")
+            report.flush()
+
+    todo = []
+    for rel_path in find_addons(args.input_dir):
+        input_path = os.path.join(args.input_dir, rel_path)
+        output_path = os.path.join(args.output_dir, rel_path)
+        signature = input_signature(input_path)
+        if not args.force and state.get(rel_path) == signature and os.path.exists(output_path):
+            emit({"input": input_path, "output": output_path, "status": "skipped"})
+        else:
+            todo.append((rel_path, input_path, output_path, signature))
+
+    start = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            futures = {
+                pool.submit(fix_one, input_path, output_path, not args.extract): (rel_path, signature)
+                for rel_path, input_path, output_path, signature in todo
+            }
+            for done, future in enumerate(as_completed(futures), start=1):
+                rel_path, signature = futures[future]
+                record = future.result()
+                emit(record)
+                if record["status"] != "error":
+                    state[rel_path] = signature
+                else:
+                    state.pop(rel_path, None)
+                print(f"[{done}/{len(todo)}] {record['status']:<9} {rel_path} ({record['seconds']:.2f}s)")
+    finally:
+        save_state(args.output_dir, state)
+        if report:
+            report.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"Done in {elapsed:.1f}s: " + ", ".join(f"{n} {status}" for status, n in sorted(counts.items())))
+    return 1 if counts.get("error") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,322 @@
+import os
+import io
+import json
+import zipfile
+import tempfile
+import shutil
+import struct
+import time
+from dotenv import load_dotenv
+from rules import DEFAULT_RULES, RuleEngine
+
+# The CLI and worker processes read their settings from .env too
+load_dotenv()
+
+# Bump whenever the fixing rules change so cached results are not reused
+FIXER_VERSION = 6
+
+# Every JSON file is parsed once and handed to all of these rules
+engine = RuleEngine.from_names(
+    [name.strip() for name in os.getenv("FIX_RULES", ",".join(DEFAULT_RULES)).split(",") if name.strip()]
+)
+VERSION = f"{FIXER_VERSION}-{engine.version}"
+
+# Archives the bot accepts and descends into when they are nested inside each other
+ADDON_EXTENSIONS = (".mcaddon", ".mcpack", ".zip")
+NESTED_MAX_DEPTH = int(os.getenv("NESTED_MAX_DEPTH", "3"))
+NESTED_SIZE_BUDGET = int(os.getenv("NESTED_BUDGET_MB", "256")) * 1024 * 1024
+
+
+def fix_json_bytes(raw, filename):
+    """Run the fix rules on one JSON file, return (new_bytes, summaries) or None if unchanged"""
+    return engine.fix_bytes(raw, filename)
+
+
+def fix_json_file(filepath, name=None):
+    """Fix a JSON file on disk in place, return its summaries (empty if unchanged)"""
+    try:
+        with open(filepath, 'rb') as f:
+            raw = f.read()
+    except Exception:
+        return []
+
+    result = fix_json_bytes(raw, name or filepath)
+    if not result:
+        return []
+
+    new_raw, summaries = result
+    try:
+        with open(filepath, 'wb') as f:
+            f.write(new_raw)
+        return summaries
+    except Exception:
+        return []
+
+
+# Local file header: signature, versions, flags, method, time, date, crc, sizes, name/extra lengths
+LOCAL_HEADER = struct.Struct("<4s2B4HL2L2H")
+DATA_DESCRIPTOR_FLAG = 0x08
+
+
+def read_raw_entry(src, info):
+    """Read the still-compressed bytes of `info` from the open source archive file"""
+    src.seek(info.header_offset)
+    header = LOCAL_HEADER.unpack(src.read(LOCAL_HEADER.size))
+    if header[0] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile(f"Bad local header for {info.filename}")
+    src.seek(header[10] + header[11], os.SEEK_CUR)
+    return src.read(info.compress_size)
+
+
+def write_raw_entry(zip_out, info, raw):
+    """Append an already-compressed entry to `zip_out` without recompressing it"""
+    out_info = zipfile.ZipInfo(info.filename, info.date_time)
+    out_info.compress_type = info.compress_type
+    out_info.create_system = info.create_system
+    out_info.external_attr = info.external_attr
+    out_info.comment = info.comment
+    # Sizes and CRC go in the local header, so no trailing data descriptor is written
+    out_info.flag_bits = info.flag_bits & ~DATA_DESCRIPTOR_FLAG
+    out_info.CRC = info.CRC
+    out_info.compress_size = info.compress_size
+    out_info.file_size = info.file_size
+
+    fp = zip_out.fp
+    fp.seek(zip_out.start_dir)
+    out_info.header_offset = fp.tell()
+    fp.write(out_info.FileHeader())
+    fp.write(raw)
+    zip_out.start_dir = fp.tell()
+    zip_out.filelist.append(out_info)
+    zip_out.NameToInfo[out_info.filename] = out_info
+    zip_out._didModify = True
+
+
+class ArchiveRewriter:
+    """Rewrites an archive entry by entry, recursing into nested pack archives in memory.
+
+    Nested archives deeper than `max_depth` or that would push the total
+    decompressed nested size over `size_budget` bytes are copied untouched.
+    """
+
+    def __init__(self, max_depth=NESTED_MAX_DEPTH, size_budget=NESTED_SIZE_BUDGET):
+        self.max_depth = max_depth
+        self.size_budget = size_budget
+        self.summaries = []
+        self.fix_seconds = 0.0
+
+    def rewrite(self, zip_in, src, zip_out, depth=0, prefix="", path=""):
+        """Copy every entry of `zip_in` into `zip_out`, return whether anything changed.
+
+        `prefix` and `path` are prepended to the `file` and `path` of the
+        summaries of nested archives: the nested archive's base name and its
+        full entry path respectively.
+        """
+        changed = False
+
+        for info in zip_in.infolist():
+            if info.is_dir():
+                pass
+            elif engine.wants(info.filename):
+                start = time.perf_counter()
+                result = fix_json_bytes(zip_in.read(info), info.filename)
+                self.fix_seconds += time.perf_counter() - start
+                if result:
+                    new_raw, summaries = result
+                    for summary in summaries:
+                        summary["file"] = prefix + summary["file"]
+                        summary["path"] = path + summary["path"]
+                    self.write_entry(zip_out, info, new_raw, zipfile.ZIP_DEFLATED)
+                    self.summaries.extend(summaries)
+                    changed = True
+                    continue
+            elif self.can_descend(info, depth):
+                self.size_budget -= info.file_size
+                new_raw = self.rewrite_nested(zip_in.read(info), depth + 1,
+                                              prefix + os.path.basename(info.filename) + "/",
+                                              path + info.filename + "/")
+                if new_raw is not None:
+                    self.write_entry(zip_out, info, new_raw, info.compress_type)
+                    changed = True
+                    continue
+
+            write_raw_entry(zip_out, info, read_raw_entry(src, info))
+
+        return changed
+
+    def can_descend(self, info, depth):
+        return (info.filename.lower().endswith(ADDON_EXTENSIONS)
+                and depth < self.max_depth
+                and info.file_size <= self.size_budget)
+
+    def rewrite_nested(self, data, depth, prefix, path):
+        """Rewrite a nested archive held in memory, return its new bytes or None if unchanged"""
+        try:
+            zip_in, src = open_archive(data)
+        except zipfile.BadZipFile:
+            return None
+
+        out = io.BytesIO()
+        with zip_in, zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as zip_out:
+            changed = self.rewrite(zip_in, src, zip_out, depth, prefix, path)
+
+        return out.getvalue() if changed else None
+
+    @staticmethod
+    def write_entry(zip_out, info, data, compress_type):
+        out_info = zipfile.ZipInfo(info.filename, info.date_time)
+        out_info.external_attr = info.external_attr
+        zip_out.writestr(out_info, data, compress_type)
+
+
+def open_archive(source):
+    """Open `source`, a path or the archive bytes, both as a ZipFile and as a raw stream"""
+    if isinstance(source, (bytes, bytearray)):
+        return zipfile.ZipFile(io.BytesIO(source), 'r'), io.BytesIO(source)
+    return zipfile.ZipFile(source, 'r'), open(source, 'rb')
+
+
+def stream_mcaddon(source, fixed_path, max_depth=NESTED_MAX_DEPTH, size_budget=NESTED_SIZE_BUDGET,
+                   stages=None):
+    """Rewrite the archive entry by entry, copying untouched entries' compressed bytes as-is"""
+    rewriter = ArchiveRewriter(max_depth, size_budget)
+    start = time.perf_counter()
+
+    zip_in, src = open_archive(source)
+    with zip_in, src, zipfile.ZipFile(fixed_path, 'w', zipfile.ZIP_DEFLATED) as zip_out:
+        rewriter.rewrite(zip_in, src, zip_out)
+
+    if stages is not None:
+        stages["fix"] = rewriter.fix_seconds
+        stages["rewrite"] = time.perf_counter() - start - rewriter.fix_seconds
+    return rewriter.summaries
+
+
+def extract_mcaddon(source, fixed_path, stages=None):
+    """Extract to a temp dir, fix in place and re-deflate every file"""
+    temp_dir = tempfile.mkdtemp()
+    summaries = []
+    stages = {} if stages is None else stages
+
+    try:
+        start = time.perf_counter()
+        with open_archive(source)[0] as zip_ref:
+            zip_ref.extractall(temp_dir)
+        stages["extract"] = time.perf_counter() - start
+
+        for root, _, files in os.walk(temp_dir):
+            for file in files:
+                abs_path = os.path.join(root, file)
+                rel_path = os.path.relpath(abs_path, temp_dir).replace(os.sep, "/")
+                if engine.wants(rel_path):
+                    summaries.extend(fix_json_file(abs_path, rel_path))
+        stages["fix"] = time.perf_counter() - start - stages["extract"]
+
+        with zipfile.ZipFile(fixed_path, 'w', zipfile.ZIP_DEFLATED) as zip_out:
+            for root, _, files in os.walk(temp_dir):
+                for file in files:
+                    abs_path = os.path.join(root, file)
+                    rel_path = os.path.relpath(abs_path, temp_dir)
+                    zip_out.write(abs_path, rel_path)
+        stages["rezip"] = time.perf_counter() - start - stages["extract"] - stages["fix"]
+
+        return summaries
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def fixed_name_for(filename):
+    base, ext = os.path.splitext(filename)
+    return f"{base}_fixed{ext}"
+
+
+def process_mcaddon(source, stream=True, stats=None, fixed_path=None):
+    """Fix an addon, return (fixed_path, summaries).
+
+    `source` is the archive's path or its bytes. Without an explicit
+    `fixed_path` the result goes to a `_fixed` copy next to the input path.
+    When a `stats` dict is given it is filled with per-stage seconds,
+    input/output sizes and the number of modified files.
+    """
+    if fixed_path is None:
+        fixed_path = fixed_name_for(source)
+    stages = {}
+
+    if stream:
+        summaries = stream_mcaddon(source, fixed_path, stages=stages)
+    else:
+        summaries = extract_mcaddon(source, fixed_path, stages=stages)
+
+    if stats is not None:
+        stats.update({
+            "stages": stages,
+            "bytes_in": len(source) if isinstance(source, (bytes, bytearray)) else os.path.getsize(source),
+            "bytes_out": os.path.getsize(fixed_path),
+            "files_modified": count_files(summaries),
+        })
+    return fixed_path, summaries
+
+
+def delta_name_for(filename):
+    base, _ = os.path.splitext(filename)
+    return f"{base}_delta.zip"
+
+
+def read_entries(zip_in, paths):
+    """Read `paths` from `zip_in` into a {path: bytes} dict, descending into nested archives.
+
+    Paths are grouped by the nested archive they are in (e.g. "packs/BP.mcpack"
+    for "packs/BP.mcpack/items/a.json") so each archive is opened only once.
+    """
+    found = {}
+    nested = {}  # archive -> {path inside it: path in zip_in}
+    for path in paths:
+        if path in zip_in.NameToInfo:
+            found[path] = zip_in.read(path)
+            continue
+        parts = path.split("/")
+        for split in range(len(parts) - 1, 0, -1):
+            archive = "/".join(parts[:split])
+            if archive.lower().endswith(ADDON_EXTENSIONS) and archive in zip_in.NameToInfo:
+                nested.setdefault(archive, {})["/".join(parts[split:])] = path
+                break
+        else:
+            raise KeyError(path)
+
+    for archive, inner_paths in nested.items():
+        with zipfile.ZipFile(io.BytesIO(zip_in.read(archive))) as nested_zip:
+            for inner, data in read_entries(nested_zip, inner_paths).items():
+                found[inner_paths[inner]] = data
+    return found
+
+
+def build_delta(fixed_path, summaries, delta_path, source_name=None):
+    """Write only the files the fixer modified, at their paths in the addon, plus a manifest.json.
+
+    Files inside nested packs keep the pack in their path, e.g.
+    `BP.mcpack/items/a.json`. Returns `delta_path`.
+    """
+    files = {}
+    for summary in summaries:
+        entry = files.setdefault(summary["path"], {"path": summary["path"], "rules": [], "changes": []})
+        entry["rules"].append(summary["rule"])
+        entry["changes"].extend(summary["changes"])
+
+    manifest = {"source": source_name, "fixer_version": VERSION, "files": list(files.values())}
+    with zipfile.ZipFile(fixed_path, 'r') as zip_in, \
+            zipfile.ZipFile(delta_path, 'w', zipfile.ZIP_DEFLATED) as zip_out:
+        for path, data in read_entries(zip_in, files).items():
+            zip_out.writestr(path, data)
+        zip_out.writestr("manifest.json", json.dumps(manifest, indent=2))
+    return delta_path
+
+
+def count_files(summaries):
+    return len({summary["path"] for summary in summaries})
+
+
+def run_fix_job(source, fixed_path=None):
+    """Worker entry point: process_mcaddon plus the stats collected along the way"""
+    stats = {}
+    fixed_path, summaries = process_mcaddon(source, stats=stats, fixed_path=fixed_path)
+    return fixed_path, summaries, stats
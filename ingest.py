@@ -0,0 +1,95 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+
+
+class AttachmentTooLarge(Exception):
+    """Raised when an attachment is, or turns out to be, bigger than the allowed size"""
+
+
+class Workspace:
+    """A private temp directory for one job, removed with everything in it on exit"""
+
+    def __init__(self, root=None):
+        self.root = root
+        self.path = None
+
+    def __enter__(self):
+        if self.root:
+            os.makedirs(self.root, exist_ok=True)
+        self.path = tempfile.mkdtemp(prefix="mcaddon-job-", dir=self.root)
+        return self
+
+    def __exit__(self, *exc):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def file(self, name, subdir=None):
+        """Path for `name` in the workspace, inside `subdir` when several files may share a name"""
+        directory = self.path
+        if subdir is not None:
+            directory = os.path.join(self.path, str(subdir))
+            os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, os.path.basename(name))
+
+
+class SpooledBuffer:
+    """Write-only buffer that stays in memory up to `max_memory` bytes, then spills to `path`.
+
+    Unlike tempfile.SpooledTemporaryFile the spilled file has a name, so it
+    can be handed to a worker process. The SHA-256 of everything written is
+    kept up to date on the way.
+    """
+
+    def __init__(self, path, max_memory):
+        self.path = path
+        self.max_memory = max_memory
+        self.memory = io.BytesIO()
+        self.file = None
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+
+    @property
+    def in_memory(self):
+        return self.file is None
+
+    def write(self, chunk):
+        self.sha256.update(chunk)
+        self.size += len(chunk)
+        if self.file is None and self.size > self.max_memory:
+            self.file = open(self.path, 'wb')
+            self.file.write(self.memory.getbuffer())
+            self.memory = None
+        if self.file is None:
+            self.memory.write(chunk)
+        else:
+            self.file.write(chunk)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+    def source(self):
+        """The buffered data for processing: bytes while in memory, else the spill file path"""
+        self.close()
+        return self.memory.getvalue() if self.in_memory else self.path
+
+    def to_path(self):
+        """Spill the data to `path` if it is still in memory and return the path"""
+        if self.in_memory:
+            with open(self.path, 'wb') as f:
+                f.write(self.memory.getbuffer())
+        return self.path
+
+
+async def download(session, url, buffer, max_bytes, chunk_size=64 * 1024):
+    """Stream `url` into `buffer`, giving up as soon as more than `max_bytes` arrive"""
+    async with session.get(url) as response:
+        response.raise_for_status()
+        async for chunk in response.content.iter_chunked(chunk_size):
+            if buffer.size + len(chunk) > max_bytes:
+                raise AttachmentTooLarge(f"more than {max_bytes} bytes")
+            buffer.write(chunk)
+    buffer.close()
+    return buffer
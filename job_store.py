@@ -0,0 +1,265 @@
+import asyncio
+import importlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from workers import QueueFull
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    status TEXT NOT NULL DEFAULT 'queued',
+    func TEXT NOT NULL,
+    args TEXT NOT NULL,
+    user_id INTEGER,
+    guild_id INTEGER,
+    worker TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    heartbeat_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id);
+"""
+
+
+def connect(path):
+    db = sqlite3.connect(path, timeout=30, isolation_level=None)
+    db.row_factory = sqlite3.Row
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    db.executescript(SCHEMA)
+    # Databases created before workers sent heartbeats lack the column
+    if "heartbeat_at" not in {row["name"] for row in db.execute("PRAGMA table_info(jobs)")}:
+        try:
+            db.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at REAL")
+        except sqlite3.OperationalError:
+            pass  # another process added it first
+    return db
+
+
+def func_name(func):
+    return f"{func.__module__}.{func.__qualname__}"
+
+
+def resolve_func(name):
+    module, _, attr = name.rpartition(".")
+    return getattr(importlib.import_module(module), attr)
+
+
+class SqliteJob:
+    def __init__(self, job_id, position):
+        self.id = job_id
+        self.position = position
+        self.future = asyncio.get_running_loop().create_future()
+        self.queued_at = time.time()
+        self.started_at = None
+
+    @property
+    def queue_wait(self):
+        """Seconds between submitting the job and a worker picking it up"""
+        return (self.started_at or time.time()) - self.queued_at
+
+    def __await__(self):
+        return self.future.__await__()
+
+
+class SqliteJobQueue:
+    """Gateway side of a job queue shared with separate worker processes through SQLite.
+
+    Has the same submit()/position/queue_wait interface as workers.JobQueue,
+    but `func` is stored by name and its arguments as JSON, so they must be
+    importable by and serialisable for the `job_worker.py` processes. The
+    per-user and per-guild limits are enforced by the workers when they
+    claim jobs.
+
+    The database is only touched from worker threads, each with its own
+    connection, so a write lock held by a worker never blocks the event loop.
+    `running` and `pending` are as of the last submit or poll. A job that
+    isn't finished `job_timeout` seconds after it was submitted fails with
+    TimeoutError, and is dropped from the queue if no worker has started it.
+    """
+
+    accepts_bytes = False
+
+    def __init__(self, path, max_queued=50, poll_interval=0.25, job_timeout=1800):
+        self.path = path
+        self.max_queued = max_queued
+        self.poll_interval = poll_interval
+        self.job_timeout = job_timeout
+        connect(path).close()  # create the schema up front
+        self.waiting = {}
+        self.abandoned = set()  # timed out job ids not yet dropped from the database
+        self.poller = None
+        self.running = 0
+        self.pending = []
+
+    async def submit(self, user_id, guild_id, func, *args):
+        """Queue `func(*args)` for the worker processes and return an awaitable SqliteJob"""
+        job_id, queued, busy = await asyncio.to_thread(
+            self._insert, user_id, guild_id, func_name(func), json.dumps(args))
+        # Workers are separate processes, so assume a job only starts right away if none are busy
+        job = SqliteJob(job_id, queued + 1 if queued or busy else 0)
+        self.waiting[job.id] = job
+
+        if self.poller is None or self.poller.done():
+            self.poller = asyncio.create_task(self._poll())
+        return job
+
+    def _insert(self, user_id, guild_id, func, args):
+        db = connect(self.path)
+        try:
+            queued = db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+            if queued >= self.max_queued:
+                raise QueueFull(f"{queued} jobs already waiting")
+
+            cursor = db.execute(
+                "INSERT INTO jobs (func, args, user_id, guild_id, created_at) VALUES (?, ?, ?, ?, ?)",
+                (func, args, user_id, guild_id, time.time()),
+            )
+            busy = db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'running'").fetchone()[0]
+            self.running = busy
+            return cursor.lastrowid, queued, busy
+        finally:
+            db.close()
+
+    async def _poll(self):
+        while self.waiting:
+            await asyncio.sleep(self.poll_interval)
+            if self.job_timeout:
+                now = time.time()
+                for job in [job for job in self.waiting.values() if now - job.queued_at > self.job_timeout]:
+                    del self.waiting[job.id]
+                    self.abandoned.add(job.id)
+                    if not job.future.done():
+                        job.future.set_exception(
+                            TimeoutError(f"job {job.id} not finished after {self.job_timeout:g}s"))
+
+            ids = list(self.waiting)
+            abandoned = list(self.abandoned)
+            try:
+                rows = await asyncio.to_thread(self._fetch, ids, abandoned)
+            except Exception as e:
+                # e.g. "database is locked" while workers write, try again next round
+                print(f"[JOBS] Polling {self.path} failed: {e}")
+                continue
+            self.abandoned.difference_update(abandoned)
+
+            for row in rows:
+                job = self.waiting.get(row["id"])
+                if job is None:
+                    continue
+                if row["started_at"] and job.started_at is None:
+                    job.started_at = row["started_at"]
+                if row["status"] in ("done", "failed"):
+                    del self.waiting[job.id]
+                    if job.future.done():
+                        continue
+                    if row["status"] == "done":
+                        job.future.set_result(tuple(json.loads(row["result"])))
+                    else:
+                        job.future.set_exception(RuntimeError(row["error"]))
+
+    def _fetch(self, ids, abandoned):
+        db = connect(self.path)
+        try:
+            if abandoned:
+                marks = ",".join("?" * len(abandoned))
+                db.execute(f"UPDATE jobs SET status = 'failed', error = 'timed out', finished_at = ? "
+                           f"WHERE status = 'queued' AND id IN ({marks})", [time.time(), *abandoned])
+            self.running = db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'running'").fetchone()[0]
+            self.pending = [row[0] for row in db.execute("SELECT id FROM jobs WHERE status = 'queued'")]
+            marks = ",".join("?" * len(ids))
+            return db.execute(
+                f"SELECT id, status, result, error, started_at FROM jobs WHERE id IN ({marks})", ids
+            ).fetchall()
+        finally:
+            db.close()
+
+    def shutdown(self):
+        if self.poller is not None:
+            self.poller.cancel()
+
+
+def claim(db, worker, per_user=1, per_guild=2):
+    """Atomically take the oldest queued job that no concurrency limit holds back"""
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        row = db.execute(
+            """
+            SELECT * FROM jobs AS q WHERE status = 'queued'
+              AND (SELECT COUNT(*) FROM jobs AS r
+                   WHERE r.status = 'running' AND r.user_id = q.user_id) < ?
+              AND (q.guild_id IS NULL OR (SELECT COUNT(*) FROM jobs AS r
+                   WHERE r.status = 'running' AND r.guild_id = q.guild_id) < ?)
+            ORDER BY id LIMIT 1
+            """,
+            (per_user, per_guild),
+        ).fetchone()
+        if row is not None:
+            now = time.time()
+            db.execute("UPDATE jobs SET status = 'running', worker = ?, started_at = ?, heartbeat_at = ? "
+                       "WHERE id = ?", (worker, now, now, row["id"]))
+        db.execute("COMMIT")
+        return row
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+
+
+def finish(db, job_id, worker, result=None, error=None):
+    """Store the outcome of a job, unless it was requeued and `worker` no longer holds it"""
+    db.execute(
+        "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? "
+        "WHERE id = ? AND status = 'running' AND worker = ?",
+        ("failed" if error else "done", None if error else json.dumps(result), error, time.time(),
+         job_id, worker),
+    )
+
+
+@contextmanager
+def heartbeat(path, job_id, worker, interval):
+    """Renew `worker`'s lease on a running job every `interval` seconds from a background thread"""
+    stop = threading.Event()
+
+    def beat():
+        db = connect(path)
+        try:
+            while not stop.wait(interval):
+                try:
+                    db.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND worker = ?",
+                               (time.time(), job_id, worker))
+                except sqlite3.Error as e:
+                    print(f"[WORKER] {worker} heartbeat for job {job_id} failed: {e}")
+        finally:
+            db.close()
+
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def requeue_stale(db, timeout):
+    """Put jobs back whose worker hasn't sent a heartbeat for `timeout` seconds"""
+    db.execute("UPDATE jobs SET status = 'queued', worker = NULL, started_at = NULL, heartbeat_at = NULL "
+               "WHERE status = 'running' AND COALESCE(heartbeat_at, started_at) < ?", (time.time() - timeout,))
+
+
+def purge_finished(db, older_than):
+    db.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+               (time.time() - older_than,))
+
+
+def default_path():
+    return os.getenv("JOB_DB", os.path.join(tempfile.gettempdir(), "mcaddon-jobs.sqlite3"))
@@ -0,0 +1,86 @@
+"""Worker processes for the split gateway/worker deployment.
+
+Claims jobs that a gateway (bot.py with DEPLOY_MODE=gateway) queued in the
+shared SQLite job database, runs them and stores the result for the gateway
+to pick up. Run as many of these as the machine has cores for, independently
+of how many shards the gateway runs:
+
+    python job_worker.py --processes 4
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import time
+import traceback
+
+import job_store
+
+
+def work(db_path, worker, per_user, per_guild, poll_interval, stale_after, heartbeat_interval):
+    db = job_store.connect(db_path)
+    last_cleanup = 0.0
+    print(f"[WORKER] {worker} waiting for jobs in {db_path}")
+
+    while True:
+        if time.monotonic() - last_cleanup > 60:
+            job_store.requeue_stale(db, stale_after)
+            job_store.purge_finished(db, older_than=3600)
+            last_cleanup = time.monotonic()
+
+        row = job_store.claim(db, worker, per_user, per_guild)
+        if row is None:
+            time.sleep(poll_interval)
+            continue
+
+        start = time.perf_counter()
+        try:
+            with job_store.heartbeat(db_path, row["id"], worker, heartbeat_interval):
+                func = job_store.resolve_func(row["func"])
+                result = func(*json.loads(row["args"]))
+        except Exception as e:
+            traceback.print_exc()
+            job_store.finish(db, row["id"], worker, error=f"{type(e).__name__}: {e}")
+            status = "failed"
+        else:
+            job_store.finish(db, row["id"], worker, result=result)
+            status = "done"
+        print(f"[WORKER] {worker} job {row['id']} {status} in {time.perf_counter() - start:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run addon fixer worker processes")
+    parser.add_argument("--db", default=job_store.default_path(), help="SQLite job database shared with the gateway")
+    parser.add_argument("--processes", type=int, default=int(os.getenv("WORKER_POOL_SIZE", "0")) or os.cpu_count() or 1)
+    parser.add_argument("--per-user", type=int, default=int(os.getenv("JOBS_PER_USER", "1")))
+    parser.add_argument("--per-guild", type=int, default=int(os.getenv("JOBS_PER_GUILD", "2")))
+    parser.add_argument("--poll", type=float, default=0.2, help="seconds between polls when idle")
+    parser.add_argument("--heartbeat", type=float, default=10,
+                        help="seconds between a busy worker's heartbeats")
+    parser.add_argument("--stale-after", type=float, default=60,
+                        help="requeue jobs whose worker sent no heartbeat for this long, e.g. because it died")
+    args = parser.parse_args()
+
+    job_store.connect(args.db).close()  # create the schema before the workers race for it
+    host = f"{socket.gethostname()}-{os.getpid()}"
+    processes = [
+        multiprocessing.Process(
+            target=work,
+            args=(args.db, f"{host}-{n}", args.per_user, args.per_guild, args.poll, args.stale_after,
+                  args.heartbeat),
+        )
+        for n in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import asyncio
+import json
+import time
+from contextlib import contextmanager
+
+# Seconds, wide enough for a tiny pack and a 200 MB addon on a slow host
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join(f'{name}="{str(value)}"'.replace("\n", " ") for name, value in pairs)
+    return "{" + body + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = label_key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{format_labels(key)} {value}")
+        return lines
+
+
+class Gauge:
+    """Gauge whose labelled values are read from `callback` at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, callback):
+        self.name = name
+        self.help_text = help_text
+        self.callback = callback
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for labels, value in self.callback():
+            lines.append(f"{self.name}{format_labels(label_key(labels))} {value}")
+        return lines
+
+
+class CallbackCounter(Gauge):
+    """Counter whose totals are kept elsewhere and read from `callback` at scrape time"""
+
+    kind = "counter"
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}  # label key -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = label_key(labels)
+        series = self.series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self.series.items()):
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{format_labels(key, [('le', bound)])} {count}")
+            lines.append(f"{self.name}_bucket{format_labels(key, [('le', '+Inf')])} {series[-1]}")
+            lines.append(f"{self.name}_sum{format_labels(key)} {series[-2]}")
+            lines.append(f"{self.name}_count{format_labels(key)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text):
+        return self.add(Counter(name, help_text))
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self.add(Histogram(name, help_text, buckets))
+
+    def gauge(self, name, help_text, callback):
+        return self.add(Gauge(name, help_text, callback))
+
+    def callback_counter(self, name, help_text, callback):
+        return self.add(CallbackCounter(name, help_text, callback))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    async def serve(self, host="127.0.0.1", port=9108):
+        """Serve `render()` over plain HTTP for Prometheus to scrape"""
+
+        async def handle(reader, writer):
+            try:
+                await reader.readline()  # request line, any path returns the metrics
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                body = self.render().encode("utf-8")
+                writer.write(
+                    b"HTTP/1.0 200 OK\r\n"
+                    b"Content-Type: text/plain; version=0.0.4\r\n"
+                    + f"Content-Length: {len(body)}\r\n\r\n".encode("ascii")
+                    + body
+                )
+                await writer.drain()
+            finally:
+                writer.close()
+
+        return await asyncio.start_server(handle, host, port)
+
+
+class JobMetrics:
+    """Per-job stage timers and counters, reported as one structured log line.
+
+    `stage_seconds` is the histogram every stage duration is observed into,
+    labelled with the stage name.
+    """
+
+    def __init__(self, stage_seconds, **fields):
+        self.stage_seconds = stage_seconds
+        self.fields = fields
+        self.stages = {}
+        self.started = time.perf_counter()
+        self.result = None
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - start)
+
+    def add_stage(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def finish(self, result):
+        self.result = result
+        total = time.perf_counter() - self.started
+        for name, seconds in self.stages.items():
+            self.stage_seconds.observe(seconds, stage=name)
+        self.stage_seconds.observe(total, stage="total")
+
+        record = {
+            "result": result,
+            **self.fields,
+            "total_s": round(total, 4),
+            "stages_s": {name: round(seconds, 4) for name, seconds in self.stages.items()},
+        }
+        print(f"[JOB] {json.dumps(record)}")
+        return record
@@ -0,0 +1,267 @@
+import abc
+import json
+import os
+
+try:
+    import orjson  # optional, much faster parsing and dumping when installed
+except ImportError:
+    orjson = None
+
+
+def load_json(raw):
+    if orjson is not None:
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            pass  # e.g. NaN or a BOM, let the stdlib decide
+    # Given bytes, json detects the encoding and accepts a UTF-8 BOM
+    return json.loads(raw)
+
+
+def dump_json(data):
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+        except TypeError:
+            pass  # e.g. integers wider than 64 bits
+    return json.dumps(data, indent=2).encode('utf-8')
+
+
+def get_components(data, root):
+    """The `components` dict of `data[root]`, or None if the file doesn't have one"""
+    if not isinstance(data, dict):
+        return None
+    definition = data.get(root)
+    if not isinstance(definition, dict):
+        return None
+    components = definition.get("components", {})
+    return components if isinstance(components, dict) else None
+
+
+def parse_version(value):
+    try:
+        return tuple(int(part) for part in str(value).split("."))
+    except ValueError:
+        return None
+
+
+def fix_tags_in_data(data):
+    """Move broken `tag:*` components into `minecraft:tags` in place, return the added tags"""
+    components = get_components(data, "minecraft:item")
+    if components is None:
+        return None
+
+    broken_tags = [k for k, v in components.items() if k.startswith("tag:") and v == {}]
+    if not broken_tags:
+        return None
+
+    tag_list = [tag[4:] for tag in broken_tags]
+
+    for tag in broken_tags:
+        components.pop(tag)
+
+    if "minecraft:tags" in components:
+        existing_tags = components["minecraft:tags"].get("tags", [])
+        if isinstance(existing_tags, list):
+            components["minecraft:tags"]["tags"] = list(set(existing_tags + tag_list))
+        else:
+            components["minecraft:tags"]["tags"] = tag_list
+    else:
+        components["minecraft:tags"] = {"tags": tag_list}
+
+    return tag_list
+
+
+class Rule(abc.ABC):
+    """A fix applied to parsed JSON files.
+
+    `folders` are the folder names whose JSON files the rule looks at. They
+    must match a whole segment of the entry's directory, at any depth, except
+    below `textures/` where resource packs reuse the names for images.
+    `markers` are byte strings of which at least one must occur in the raw
+    file for the rule to possibly apply; an empty tuple means the rule always
+    wants the file parsed. `label` is the singular noun the summary embed
+    uses for one change.
+    """
+
+    name = ""
+    label = "change"
+    folders = ()
+    markers = ()
+
+    def wants_path(self, filename):
+        if not filename.endswith(".json"):
+            return False
+        segments = filename.replace("\\", "/").split("/")[:-1]
+        return any(segment in self.folders and (index == 0 or segments[index - 1] != "textures")
+                   for index, segment in enumerate(segments))
+
+    def wants_bytes(self, raw):
+        return not self.markers or any(marker in raw for marker in self.markers)
+
+    @abc.abstractmethod
+    def apply(self, data):
+        """Fix `data` in place, return a list describing each change (empty if none)"""
+
+
+class TagsRule(Rule):
+    """Broken `tag:*: {}` item components become entries of `minecraft:tags`"""
+
+    name = "tags"
+    label = "tag"
+    folders = ("items",)
+    markers = (b'"tag:',)
+
+    def apply(self, data):
+        return fix_tags_in_data(data) or []
+
+
+class RenameComponentsRule(Rule):
+    """Replaces deprecated components of one definition type with their successors.
+
+    `renames` maps an old component to (new component, value converter, the
+    format_version the new component needs). A rename only happens in files
+    that already declare that format_version, so older files stay valid.
+    An existing new component wins over the deprecated one, which is dropped.
+    """
+
+    root = ""
+    renames = {}
+
+    @property
+    def markers(self):
+        return tuple(f'"{old}"'.encode('utf-8') for old in self.renames)
+
+    def apply(self, data):
+        components = get_components(data, self.root)
+        if components is None:
+            return []
+        version = parse_version(data.get("format_version"))
+        if version is None:
+            return []
+
+        changes = []
+        for old, (new, convert, since) in self.renames.items():
+            if old not in components or version < parse_version(since):
+                continue
+            value = components.pop(old)
+            if new not in components:
+                try:
+                    components[new] = convert(value)
+                except (TypeError, ValueError):
+                    components[old] = value  # unexpected shape, leave it for a human
+                    continue
+            changes.append(f"{old} → {new}")
+        return changes
+
+
+class ItemComponentsRule(RenameComponentsRule):
+    name = "item_components"
+    label = "component"
+    folders = ("items",)
+    root = "minecraft:item"
+    renames = {
+        "minecraft:foil": ("minecraft:glint", bool, "1.20.10"),
+    }
+
+
+class BlockComponentsRule(RenameComponentsRule):
+    name = "block_components"
+    label = "component"
+    folders = ("blocks",)
+    root = "minecraft:block"
+    renames = {
+        "minecraft:destroy_time": ("minecraft:destructible_by_mining",
+                                   lambda v: {"seconds_to_destroy": float(v)}, "1.19.20"),
+        "minecraft:explosion_resistance": ("minecraft:destructible_by_explosion",
+                                           lambda v: {"explosion_resistance": float(v)}, "1.19.20"),
+        "minecraft:block_light_emission": ("minecraft:light_emission",
+                                           lambda v: round(float(v) * 15), "1.19.40"),
+        "minecraft:block_light_absorption": ("minecraft:light_dampening", int, "1.19.40"),
+        "minecraft:block_light_filter": ("minecraft:light_dampening", int, "1.19.40"),
+    }
+
+
+class FormatVersionRule(Rule):
+    """Raises `format_version` of item/block files already on the component schema.
+
+    Files older than 1.16.100 use a different schema and are left alone.
+    """
+
+    name = "format_version"
+    label = "change"
+    folders = ("items", "blocks")
+    markers = (b'"format_version"',)
+    schema_version = (1, 16, 100)
+
+    def __init__(self, minimum="1.20.50"):
+        self.minimum = minimum
+
+    def apply(self, data):
+        if not isinstance(data, dict):
+            return []
+        current = parse_version(data.get("format_version"))
+        if current is None or current < self.schema_version or current >= parse_version(self.minimum):
+            return []
+        old = data["format_version"]
+        data["format_version"] = self.minimum
+        return [f"{old} → {self.minimum}"]
+
+
+RULES = {
+    rule.name: rule
+    for rule in (TagsRule(), ItemComponentsRule(), BlockComponentsRule(), FormatVersionRule())
+}
+DEFAULT_RULES = ("tags", "item_components", "block_components")
+
+
+class RuleEngine:
+    """Parses each JSON file at most once and runs every interested rule on it"""
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+
+    @classmethod
+    def from_names(cls, names):
+        unknown = [name for name in names if name not in RULES]
+        if unknown:
+            raise ValueError(f"Unknown fix rules: {', '.join(unknown)}")
+        return cls(RULES[name] for name in names)
+
+    @property
+    def version(self):
+        """Identifies the rule set, so results of different rule sets aren't mixed up"""
+        return "+".join(rule.name for rule in self.rules)
+
+    def wants(self, filename):
+        return any(rule.wants_path(filename) for rule in self.rules)
+
+    def label(self, rule_name):
+        rule = RULES.get(rule_name)
+        return rule.label if rule else "change"
+
+    def fix_bytes(self, raw, filename):
+        """Fix the JSON document in `raw`, return (new_bytes, summaries) or None if unchanged.
+
+        Each summary names the file both by its base name (`file`) and by the
+        `filename` it was given (`path`).
+        """
+        rules = [rule for rule in self.rules if rule.wants_path(filename) and rule.wants_bytes(raw)]
+        if not rules:
+            return None
+
+        try:
+            data = load_json(raw)
+        except Exception:
+            return None  # Not a valid JSON
+
+        file = os.path.basename(filename)
+        summaries = []
+        for rule in rules:
+            changes = rule.apply(data)
+            if changes:
+                summaries.append({"file": file, "path": filename, "rule": rule.name, "changes": changes})
+
+        if not summaries:
+            return None
+        return dump_json(data), summaries
@@ -0,0 +1,134 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+class QueueFull(Exception):
+    """Raised when the job queue already holds its maximum number of waiting jobs"""
+
+
+class Job:
+    def __init__(self, user_id, guild_id, func, args):
+        self.user_id = user_id
+        self.guild_id = guild_id
+        self.func = func
+        self.args = args
+        self.future = asyncio.get_running_loop().create_future()
+        self.position = 0  # 0 once the job is running, otherwise its place in the queue
+        self.queued_at = time.perf_counter()
+        self.started_at = None
+
+    @property
+    def queue_wait(self):
+        """Seconds between submitting the job and a worker picking it up"""
+        if self.started_at is None:
+            return time.perf_counter() - self.queued_at
+        return self.started_at - self.queued_at
+
+    def __await__(self):
+        return self.future.__await__()
+
+
+class JobQueue:
+    """Bounded FIFO of CPU-heavy jobs dispatched to a process pool.
+
+    At most `pool_size` jobs run at once, and at most `per_user` / `per_guild`
+    of them may belong to the same user or guild. Jobs that cannot start yet
+    wait in order; jobs held back by a limit let later jobs from others pass.
+    """
+
+    accepts_bytes = True  # job arguments are pickled, so archive bytes can be passed directly
+
+    def __init__(self, pool_size=None, max_queued=50, per_user=1, per_guild=2):
+        self.pool_size = pool_size or os.cpu_count() or 1
+        self.max_queued = max_queued
+        self.per_user = per_user
+        self.per_guild = per_guild
+        self.executor = None
+        self.pending = deque()
+        self.running = 0
+        self.user_running = {}
+        self.guild_running = {}
+
+    async def submit(self, user_id, guild_id, func, *args):
+        """Queue `func(*args)` for the pool and return an awaitable Job"""
+        if len(self.pending) >= self.max_queued:
+            raise QueueFull(f"{len(self.pending)} jobs already waiting")
+
+        job = Job(user_id, guild_id, func, args)
+        self.pending.append(job)
+        self._dispatch()
+        return job
+
+    def _can_start(self, job):
+        if self.user_running.get(job.user_id, 0) >= self.per_user:
+            return False
+        if job.guild_id is not None and self.guild_running.get(job.guild_id, 0) >= self.per_guild:
+            return False
+        return True
+
+    def _dispatch(self):
+        for job in list(self.pending):
+            if self.running >= self.pool_size:
+                break
+            if self._can_start(job):
+                self.pending.remove(job)
+                self._start(job)
+
+        for position, job in enumerate(self.pending, start=1):
+            job.position = position
+
+    def _executor(self):
+        if self.executor is None:
+            # Forking a process that already runs helper threads can deadlock the child
+            self.executor = ProcessPoolExecutor(max_workers=self.pool_size,
+                                                mp_context=multiprocessing.get_context("spawn"))
+        return self.executor
+
+    def _start(self, job):
+        self.running += 1
+        self.user_running[job.user_id] = self.user_running.get(job.user_id, 0) + 1
+        if job.guild_id is not None:
+            self.guild_running[job.guild_id] = self.guild_running.get(job.guild_id, 0) + 1
+        job.position = 0
+        job.started_at = time.perf_counter()
+
+        loop = asyncio.get_running_loop()
+        try:
+            task = loop.run_in_executor(self._executor(), job.func, *job.args)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for using too much memory), start a fresh pool
+            self.executor = None
+            task = loop.run_in_executor(self._executor(), job.func, *job.args)
+        task.add_done_callback(lambda done: self._finish(job, done))
+
+    def _finish(self, job, done):
+        self.running -= 1
+        self._release(self.user_running, job.user_id)
+        if job.guild_id is not None:
+            self._release(self.guild_running, job.guild_id)
+
+        if not job.future.done():
+            if done.cancelled():
+                job.future.cancel()
+            elif done.exception() is not None:
+                job.future.set_exception(done.exception())
+            else:
+                job.future.set_result(done.result())
+
+        self._dispatch()
+
+    @staticmethod
+    def _release(counts, key):
+        counts[key] -= 1
+        if counts[key] <= 0:
+            del counts[key]
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None